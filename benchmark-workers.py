@@ -0,0 +1,161 @@
+import sys
+import os
+import time
+import argparse
+import subprocess
+import numpy
+import pandas
+from tabulate import tabulate
+from media_file import File, FARID_SCHEMA, NPELO_SCHEMA
+from classifiers import CLASSIFIER_FILES, classifiers_found, load_classifiers, classify_files
+from work_queue import ForkedWorker, can_fork
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+MODES = ('spawn', 'spawn-mmap', 'fork')
+RESULTS_FILE = 'worker-benchmark.csv'
+KB = 1024
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: CLASSIFY ONE DUMMY IMAGE & VIDEO, SO EVERY PAGE A REAL CLASSIFICATION TOUCHES IS IN MEMORY
+def warm_up(classifiers):
+    files = []
+    for file_type, schema in (('image', FARID_SCHEMA), ('video', NPELO_SCHEMA)):
+        file = File('warm-up')
+        file.update_file(file_type, '', 0)
+        file.set_features(schema, numpy.zeros((1, len(schema))))
+        files.append(file)
+    classify_files(files, classifiers)
+
+
+# FUNCTION: WORKER - GET CLASSIFIERS, WARM UP, SIGNAL READY & WAIT TO BE MEASURED
+def run_child(ready_fd, release_fd, unused_fd=None, classifiers=None, mmap=True):
+    if unused_fd is not None:
+        # a forked child holds its own copy of the release pipe's write end, which would stop it ever closing
+        os.close(unused_fd)
+    if classifiers is None:
+        classifiers = load_classifiers(mmap=mmap)
+    warm_up(classifiers)
+    os.write(ready_fd, b'1')
+    os.read(release_fd, 1)
+
+
+# FUNCTION: READ A PROCESS'S MEMORY USE (MB) -> { rss, pss, uss }
+def process_memory(pid):
+    memory = {'rss': None, 'pss': None, 'uss': None}
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid), 'r') as smaps:
+            fields = {line.split(':')[0]: int(line.split()[1]) for line in smaps if line.split()[-1] == 'kB'}
+    except OSError:
+        return memory  # not Linux, or too old a kernel
+    memory['rss'] = fields['Rss'] / KB
+    # PSS splits shared pages between their users & USS is only this process's pages, so they show the sharing
+    memory['pss'] = fields['Pss'] / KB
+    memory['uss'] = (fields['Private_Clean'] + fields['Private_Dirty']) / KB
+    return memory
+
+
+# FUNCTION: START WORKERS IN ONE MODE & MEASURE THEM
+def benchmark_mode(mode, workers):
+    print('[*] Starting {} {} workers ... '.format(workers, mode))
+    parent_load = None
+    classifiers = None
+    if mode == 'fork':
+        started = time.perf_counter()
+        classifiers = load_classifiers()
+        warm_up(classifiers)
+        parent_load = time.perf_counter() - started
+
+    ready_read, ready_write = os.pipe()
+    release_read, release_write = os.pipe()
+    processes = []
+    spawn_times = []
+    try:
+        for _ in range(workers):
+            # one at a time, so each start is timed without the others competing for CPU
+            started = time.perf_counter()
+            if mode == 'fork':
+                process = ForkedWorker(run_child, ready_write, release_read, release_write, classifiers)
+            else:
+                process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', mode,
+                                            str(ready_write), str(release_read)],
+                                           pass_fds=(ready_write, release_read))
+            processes.append(process)
+            if not os.read(ready_read, 1):
+                raise RuntimeError('A {} worker exited before it was ready'.format(mode))
+            spawn_times.append(time.perf_counter() - started)
+        memory = [process_memory(process.pid) for process in processes]
+    finally:
+        os.close(release_write)
+        for process in processes:
+            process.wait()
+        for fd in (ready_read, ready_write, release_read):
+            os.close(fd)
+
+    def mean(key):
+        values = [worker_memory[key] for worker_memory in memory if worker_memory[key] is not None]
+        return sum(values) / len(values) if values else None
+
+    pss = [worker_memory['pss'] for worker_memory in memory if worker_memory['pss'] is not None]
+    return [mode, workers, parent_load, sum(spawn_times) / len(spawn_times), max(spawn_times), mean('rss'),
+            mean('pss'), mean('uss'), sum(pss) if pss else None]
+
+
+# FUNCTION: RUN PROGRAM
+def run(modes, workers):
+    model_size = sum(os.path.getsize(joblib_file) for type_files in CLASSIFIER_FILES.values()
+                     for joblib_file in type_files.values())
+    print('[*] Classifier files: {:.1f} MB'.format(model_size / KB / KB))
+
+    rows = [benchmark_mode(mode, workers) for mode in modes]
+    cols = ['Mode', 'Workers', 'Parent load (s)', 'Mean start (s)', 'Max start (s)', 'Mean RSS (MB)',
+            'Mean PSS (MB)', 'Mean USS (MB)', 'Total PSS (MB)']
+    results_df = pandas.DataFrame(rows, columns=cols)
+    results_df.to_csv(RESULTS_FILE, index=False)
+    print('\n=== Worker start time & memory ===\n')
+    print(tabulate(rows, headers=cols, tablefmt='psql', floatfmt='.3f', missingval='-'))
+    print('\nBenchmark results also saved to {}\n'.format(RESULTS_FILE))
+
+
+# MAIN FUNCTION: GLOBAL VARIABLES
+if __name__ == '__main__':
+    # argument parsing
+    parser = argparse.ArgumentParser(description='A script to measure how long local workers take to start & how '
+                                                 'much memory each uses, for each way of loading the classifiers.')
+    parser.add_argument('-n', '--workers', action='store', type=int, default=4,
+                        help='Workers to start per mode (default: 4)')
+    parser.add_argument('-m', '--modes', action='store', nargs='+', choices=MODES,
+                        help='spawn: fresh processes that each load the classifiers, spawn-mmap: the same but '
+                             'memory-mapped, fork: forked from a parent that loaded them once (default: all)')
+    parser.add_argument('--child', action='store', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # handle arguments
+    if args.child:
+        mode, ready_fd, release_fd = args.child
+        run_child(int(ready_fd), int(release_fd), mmap=mode == 'spawn-mmap')
+        sys.exit(0)
+
+    if not classifiers_found():
+        print('Classifiers not found!')
+        sys.exit(1)
+
+    modes = args.modes or [mode for mode in MODES if mode != 'fork' or can_fork()]
+    if 'fork' in modes and not can_fork():
+        print('fork is not available on this platform')
+        sys.exit(1)
+
+    run(modes, args.workers)
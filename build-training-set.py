@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import http.client
+import importlib
+import json
+import os
+import random
+import shutil
+import string
+import sys
+import threading
+import subprocess
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+JPEG_MAGIC = b'\xff\xd8\xff'
+JPEG_EOI = b'\xff\xd9'
+MANIFEST_NAME = 'manifest.jsonl'
+REQUEST_TIMEOUT = 30  # seconds, matches the old `curl -m 30`
+EMBED_SUFFIX = '.embed.part'
+PASSWORD_COUNT = 25
+SECRET_FILE_COUNT = 50
+
+
+# --------------------------------------------
+
+# CLASSES
+
+# --------------------------------------------
+
+
+class Manifest:
+    """
+    Append-only record of finished work, used to resume an interrupted build.
+
+    Attributes:
+        path: A string containing the manifest file path
+        records: A dict of structure { (stage, group, url) : latest record }
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        if os.path.isfile(path):
+            with open(path, 'r') as manifest_file:
+                for line in manifest_file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a torn final line from an interrupted run
+                    self.records[(record['stage'], record['group'], record['url'])] = record
+        self.handle = open(path, 'a')
+
+    def get(self, stage, group, url):
+        return self.records.get((stage, group, url))
+
+    def is_done(self, stage, group, url):
+        record = self.get(stage, group, url)
+        # failed downloads & embeds are retried on resume, rejected/ok ones are not
+        return record is not None and record['status'] != 'failed'
+
+    def add(self, record):
+        self.records[(record['stage'], record['group'], record['url'])] = record
+        self.handle.write(json.dumps(record) + '\n')
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+
+class ConnectionPool:
+    """
+    Per-thread keep-alive HTTP(S) connections, one per host.
+    """
+
+    def __init__(self, timeout=REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def get_connection(self, scheme, netloc):
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+        key = (scheme, netloc)
+        if key not in self.local.connections:
+            if scheme == 'https':
+                connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            self.local.connections[key] = connection
+        return self.local.connections[key]
+
+    def drop_connection(self, scheme, netloc):
+        connection = self.local.connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def fetch(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path = '{}?{}'.format(path, parsed.query)
+        # a pooled connection may have been closed by the server, so retry once on a fresh one
+        for attempt in range(2):
+            connection = self.get_connection(parsed.scheme, parsed.netloc)
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                body = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.drop_connection(parsed.scheme, parsed.netloc)
+                return response.status, body
+            except (http.client.HTTPException, OSError):
+                self.drop_connection(parsed.scheme, parsed.netloc)
+                if attempt == 1:
+                    raise
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: CHECK DATA IS A JPEG (REPLACES `file -b`)
+def is_jpeg(data):
+    return len(data) > len(JPEG_MAGIC) + len(JPEG_EOI) and data.startswith(JPEG_MAGIC)
+
+
+# FUNCTION: GET FILE NAME FROM URL (SAME AS ${line##*/})
+def url_file_name(url):
+    return url.rsplit('/', 1)[-1]
+
+
+# FUNCTION: DOWNLOAD ONE URL INTO A GROUP FOLDER
+def download_image(pool, url, group, group_dir):
+    file_name = url_file_name(url)
+    record = {'stage': 'download', 'group': group, 'url': url, 'file': file_name}
+    try:
+        status, body = pool.fetch(url)
+    except (http.client.HTTPException, OSError, ValueError) as error:
+        record.update(status='failed', reason=str(error))
+        return record
+    if status != 200:
+        record.update(status='failed', reason='HTTP {}'.format(status))
+        return record
+    if not file_name or not is_jpeg(body):
+        record.update(status='rejected', reason='empty or non-jpeg')
+        return record
+    # write to a partial file first so an interruption never leaves a truncated image behind
+    file_path = os.path.join(group_dir, file_name)
+    partial_path = file_path + '.part'
+    with open(partial_path, 'wb') as image_file:
+        image_file.write(body)
+    os.replace(partial_path, file_path)
+    record.update(status='ok', size=len(body))
+    return record
+
+
+# FUNCTION: DOWNLOAD URL LIST CONCURRENTLY
+def download_group(urls, group, output_dir, manifest, workers):
+    group_dir = os.path.join(output_dir, group)
+    pending = [url for url in urls if not manifest.is_done('download', group, url)]
+    print('[*] {} {} URLs ({} already done)'.format(len(urls), group, len(urls) - len(pending)))
+    pool = ConnectionPool()
+    completed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(download_image, pool, url, group, group_dir) for url in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            manifest.add(record)
+            completed = completed + 1
+            print('{} / {} {} ({})'.format(completed, len(pending), record['file'], record['status']))
+
+
+# FUNCTION: MAKE A PWGEN -S STYLE RANDOM STRING
+def random_string(rng, length):
+    alphabet = string.ascii_letters + string.digits
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+# FUNCTION: CREATE PASSWORDS & SECRET FILES (REUSED ON RESUME)
+def create_secrets(secrets_dir, rng):
+    os.makedirs(secrets_dir, exist_ok=True)
+    pwd_file = os.path.join(secrets_dir, 'passwords.txt')
+    if not os.path.isfile(pwd_file):
+        print('[*] Creating passwords ... ')
+        with open(pwd_file, 'w') as passwords:
+            for _ in range(PASSWORD_COUNT):
+                passwords.write(random_string(rng, rng.randint(8, 36)) + '\n')
+    secret_files = []
+    for i in range(1, SECRET_FILE_COUNT + 1):
+        file_name = os.path.join(secrets_dir, 'secret_file_{}.txt'.format(i))
+        if not os.path.isfile(file_name):
+            with open(file_name, 'w') as secret:
+                secret.write(random_string(rng, rng.randint(25, 200)) + '\n')
+        secret_files.append(file_name)
+    with open(pwd_file, 'r') as passwords:
+        password_list = [line.strip() for line in passwords if line.strip()]
+    return password_list, secret_files
+
+
+# FUNCTION: EMBEDDER - STEGHIDE
+def steghide_embed(cover_file, secret_file, password):
+    cmd = ['steghide', 'embed', '-q', '-cf', cover_file, '-ef', secret_file, '-p', password]
+    return subprocess.call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+
+
+# FUNCTION: EMBEDDER - APPEND (STAND-IN THAT NEEDS NO EXTERNAL TOOLS)
+def append_embed(cover_file, secret_file, password):
+    with open(secret_file, 'rb') as secret:
+        payload = secret.read()
+    with open(cover_file, 'ab') as cover:
+        cover.write(password.encode('utf-8') + b'\n' + payload)
+    return True
+
+
+EMBEDDERS = {
+    'steghide': steghide_embed,
+    'append': append_embed,
+}
+
+
+# FUNCTION: GET EMBEDDER BY NAME OR module:function
+def get_embedder(name):
+    if name == 'steghide' and shutil.which('steghide') is None:
+        raise ValueError('steghide not found, install it or pick another --embedder')
+    if name in EMBEDDERS:
+        return EMBEDDERS[name]
+    if ':' in name:
+        module_name, function_name = name.split(':', 1)
+        return getattr(importlib.import_module(module_name), function_name)
+    raise ValueError('Unknown embedder: {}'.format(name))
+
+
+# FUNCTION: RUN AN EMBEDDER ON A COPY OF THE COVER FILE, SO THE ORIGINAL IS ONLY EVER CLEAN OR FULLY EMBEDDED
+def embed_copy(embedder, file_path, secret_file, password):
+    embed_path = file_path + EMBED_SUFFIX
+    shutil.copyfile(file_path, embed_path)
+    try:
+        success = embedder(embed_path, secret_file, password)
+    except BaseException:
+        os.remove(embed_path)
+        raise
+    if not success:
+        os.remove(embed_path)
+    return success
+
+
+# FUNCTION: FINISH EMBEDS RECORDED BY AN INTERRUPTED RUN
+def finish_embeds(output_dir, manifest):
+    for (stage, group, url), record in list(manifest.records.items()):
+        if stage != 'embed':
+            continue
+        file_path = os.path.join(output_dir, 'stego', record['file'])
+        embed_path = file_path + EMBED_SUFFIX
+        if record['status'] == 'ok' and os.path.exists(embed_path):
+            os.replace(embed_path, file_path)
+        elif record['status'] == 'rejected' and os.path.exists(file_path):
+            # failed embeds are left alone, as they are tried again
+            os.remove(file_path)
+
+
+# FUNCTION: WRITE PWD-INFO.CSV FROM THE MANIFEST, SO IT ALWAYS MATCHES THE STEGO FILES ON DISK
+def write_pwd_info(csv_path, output_dir, manifest):
+    partial_path = csv_path + '.part'
+    with open(partial_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file, delimiter='\t')
+        writer.writerow(['filename', 'secret', 'password'])
+        for (stage, group, url), record in manifest.records.items():
+            if stage == 'embed' and record['status'] == 'ok':
+                writer.writerow([os.path.join(output_dir, 'stego', record['file']), record['secret'],
+                                 record['password']])
+    os.replace(partial_path, csv_path)
+
+
+# FUNCTION: EMBED SECRETS INTO STEGO FILES IN A PROCESS POOL
+def embed_group(output_dir, secrets_dir, manifest, embedder, workers, rng):
+    password_list, secret_files = create_secrets(secrets_dir, rng)
+    finish_embeds(output_dir, manifest)
+    jobs = []
+    for (stage, group, url), record in list(manifest.records.items()):
+        if stage != 'download' or group != 'stego' or record['status'] != 'ok':
+            continue
+        if manifest.is_done('embed', group, url):
+            continue
+        file_path = os.path.join(output_dir, 'stego', record['file'])
+        if os.path.isfile(file_path):
+            jobs.append((url, file_path, rng.choice(secret_files), rng.choice(password_list)))
+    print('[*] Embedding secrets into {} files ... '.format(len(jobs)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(embed_copy, embedder, file_path, secret_file, password):
+                   (url, file_path, secret_file, password) for url, file_path, secret_file, password in jobs}
+        for future in as_completed(futures):
+            url, file_path, secret_file, password = futures[future]
+            record = {'stage': 'embed', 'group': 'stego', 'url': url, 'file': os.path.basename(file_path)}
+            try:
+                success = future.result()
+            except Exception as error:
+                # the embedder broke, which says nothing about the image - keep it for the next run
+                print('[!] Embedder error on {}: {}'.format(file_path, error))
+                manifest.add(dict(record, status='failed', reason=str(error)))
+                continue
+            if success:
+                record.update(status='ok', secret=secret_file, password=password)
+            else:
+                record.update(status='rejected')
+            # recorded before the file is touched, so a resume finishes the change rather than repeating it
+            manifest.add(record)
+            if success:
+                print('Success: {}'.format(file_path))
+                os.replace(file_path + EMBED_SUFFIX, file_path)
+            else:
+                # too small for the payload - remove, as before
+                print('Fail. Removing file {}'.format(file_path))
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+    write_pwd_info(os.path.join(secrets_dir, 'pwd-info.csv'), output_dir, manifest)
+
+
+# FUNCTION: PICK STEGO & CLEAN URLS (KEPT ON DISK SO A RESUME USES THE SAME LISTS)
+def select_urls(url_list, list_path, count, rng):
+    if os.path.isfile(list_path):
+        with open(list_path, 'r') as existing:
+            return [line.strip() for line in existing if line.strip()]
+    with open(url_list, 'r') as url_file:
+        # url lists are "<id> <url>" per line, as with the old awk '{print $2}'
+        urls = [line.split()[1] for line in url_file if len(line.split()) > 1]
+    selected = rng.sample(urls, min(count, len(urls)))
+    with open(list_path, 'w') as out_file:
+        out_file.write('\n'.join(selected) + '\n')
+    return selected
+
+
+# FUNCTION: COUNT FILES IN A FOLDER
+def count_files(dir_path):
+    return len([name for name in os.listdir(dir_path)
+                if os.path.isfile(os.path.join(dir_path, name)) and not name.endswith('.part')])
+
+
+# FUNCTION: RUN PROGRAM
+def run(args):
+    # found before downloading anything, so a missing embedder fails straight away
+    embedder = None if args.skip_embed else get_embedder(args.embedder)
+    rng = random.Random(args.seed)
+    for group in ('clean', 'stego'):
+        os.makedirs(os.path.join(args.output_dir, group), exist_ok=True)
+    manifest = Manifest(os.path.join(args.output_dir, MANIFEST_NAME))
+    try:
+        print('\n===== SELECTING URLS =====\n')
+        stego_urls = select_urls(args.url_list, os.path.join(args.output_dir, 'stego_url_list.txt'), args.count, rng)
+        clean_urls = select_urls(args.url_list, os.path.join(args.output_dir, 'clean_url_list.txt'), args.count, rng)
+
+        print('\n===== DOWNLOADING IMAGES =====\n')
+        download_group(stego_urls, 'stego', args.output_dir, manifest, args.download_workers)
+        download_group(clean_urls, 'clean', args.output_dir, manifest, args.download_workers)
+        print('[*] Total images gathered for stego files: {}'.format(count_files(os.path.join(args.output_dir, 'stego'))))
+        print('[*] Total images gathered for clean files: {}'.format(count_files(os.path.join(args.output_dir, 'clean'))))
+
+        if args.skip_embed:
+            return
+        print('\n===== PERFORMING STEGANOGRAPHY =====\n')
+        embed_group(args.output_dir, args.secrets_dir, manifest, embedder, args.embed_workers, rng)
+        print('[*] Final stego files: {}'.format(count_files(os.path.join(args.output_dir, 'stego'))))
+    finally:
+        manifest.close()
+
+
+# MAIN FUNCTION: GLOBAL CODE
+if __name__ == '__main__':
+    # argument parsing
+    parser = argparse.ArgumentParser(description='A script to download, validate & embed steganalysis training '
+                                                 'images from a list of URLs. Interrupted runs resume from the '
+                                                 'manifest in the output directory.')
+    parser.add_argument('url_list', action='store', help='Text file of "<id> <url>" lines')
+    parser.add_argument('-o', '--output-dir', action='store', default='training-data',
+                        help='Folder for clean/ and stego/ images (default: training-data)')
+    parser.add_argument('-s', '--secrets-dir', action='store', default='secrets',
+                        help='Folder for passwords, secret files & pwd-info.csv (default: secrets)')
+    parser.add_argument('-n', '--count', action='store', type=int, default=1500,
+                        help='Number of URLs to pick for each of clean & stego (default: 1500)')
+    parser.add_argument('--download-workers', action='store', type=int, default=16,
+                        help='Concurrent downloads (default: 16)')
+    parser.add_argument('--embed-workers', action='store', type=int, default=os.cpu_count(),
+                        help='Embedding processes (default: CPU count)')
+    parser.add_argument('--embedder', action='store', default='steghide',
+                        help='Embedder: {} or module:function (default: steghide)'.format(', '.join(EMBEDDERS)))
+    parser.add_argument('--seed', action='store', type=int, default=None, help='Seed for URL, secret & password picks')
+    parser.add_argument('--skip-embed', action='store_true', help='Only download & validate images')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.url_list):
+        print('Error! URL list not found. Check input and try again.')
+        sys.exit(1)
+    if not args.skip_embed:
+        try:
+            get_embedder(args.embedder)
+        except (ValueError, ImportError, AttributeError) as error:
+            print('Error! {}'.format(error))
+            sys.exit(1)
+
+    run(args)
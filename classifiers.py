@@ -0,0 +1,74 @@
+import os
+import numpy
+from sklearn import svm  # note: this is needed for the imported classifiers
+import joblib
+from extraction import find_file
+from media_file import features_dataframe
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+# { file_type : { classifier : joblib file } } - svm first, as in the classifications table
+CLASSIFIER_FILES = {
+    'image': {'svm': 'img-svm.joblib', 'lr': 'img-lr.joblib'},
+    'video': {'svm': 'vid-svm.joblib', 'lr': 'vid-lr.joblib'},
+}
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: CHECK EVERY CLASSIFIER FILE EXISTS
+def classifiers_found():
+    return all(find_file(joblib_file) for type_files in CLASSIFIER_FILES.values() for joblib_file in type_files.values())
+
+
+# FUNCTION: LOAD CLASSIFIERS -> { file_type : { classifier : model } }
+def load_classifiers(mmap=True):
+    # memory-mapped arrays (support vectors, coefficients) are read straight from the page cache, so every
+    # process on a host shares one copy - compressed .joblib files cannot be mapped & are read as normal
+    mmap_mode = 'r' if mmap else None
+    classifiers = {}
+    for file_type, type_files in CLASSIFIER_FILES.items():
+        classifiers[file_type] = {}
+        for classifier_name, joblib_file in type_files.items():
+            classifiers[file_type][classifier_name] = joblib.load(joblib_file, mmap_mode=mmap_mode)
+    return classifiers
+
+
+# FUNCTION: SAVE A CLASSIFIER WITHOUT DISTURBING PROCESSES THAT HAVE THE OLD ONE MAPPED
+def save_classifier(classifier, joblib_file):
+    # dumping over the old file would truncate it under any worker mapping it (SIGBUS), so replace it instead
+    temp_path = '{}.{}.tmp'.format(joblib_file, os.getpid())
+    joblib.dump(classifier, temp_path)
+    os.replace(temp_path, joblib_file)
+
+
+# FUNCTION: CLASSIFY A BATCH OF FILES WITH ONE PREDICT CALL PER CLASSIFIER
+def classify_files(files, classifiers):
+    for file_type in ('image', 'video'):
+        type_files = [file for file in files if file.file_type == file_type and file.features is not None]
+        if not type_files:
+            continue
+        # stack every row (one per image, one per GOP) & remember where each file's rows are
+        row_counts = [len(file.features) for file in type_files]
+        ends = numpy.cumsum(row_counts)
+        features = features_dataframe(type_files)
+        for classifier_name, classifier in classifiers[file_type].items():
+            predictions = classifier.predict(features)
+            for file, end, row_count in zip(type_files, ends, row_counts):
+                # a video is stego if any of its GOPs is
+                if 1 in predictions[end - row_count:end]:
+                    file.set_classification(classifier_name, 'stego')
+                else:
+                    file.set_classification(classifier_name, 'clean')
+    return files
@@ -0,0 +1,421 @@
+import os
+import struct
+import uuid
+import threading
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+ANNEXB_START_CODE = b'\x00\x00\x00\x01'
+MKV_MAGIC = b'\x1a\x45\xdf\xa3'
+MP4_TOP_LEVEL_BOXES = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot')
+MP4_AVC_ENTRIES = (b'avc1', b'avc3')
+MKV_AVC_CODEC = 'V_MPEG4/ISO/AVC'
+MKV_VIDEO_TRACK = 1
+
+# matroska element ids (with their length marker bits, as they appear in the file)
+MKV_SEGMENT = 0x18538067
+MKV_CLUSTER = 0x1F43B675
+MKV_BLOCK_GROUP = 0xA0
+MKV_BLOCK = 0xA1
+MKV_SIMPLE_BLOCK = 0xA3
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_NUMBER = 0xD7
+MKV_TRACK_TYPE = 0x83
+MKV_CODEC_ID = 0x86
+MKV_CODEC_PRIVATE = 0x63A2
+MKV_MASTER_ELEMENTS = (MKV_SEGMENT, MKV_CLUSTER, MKV_BLOCK_GROUP)  # read into rather than skipped
+
+PIPE_OPEN_POLL = 0.1  # seconds between checks for the extractor opening the pipe
+PIPE_FINISH_TIMEOUT = 10  # seconds to wait for the demuxer to finish once the extractor has exited
+
+
+# --------------------------------------------
+
+# CLASSES
+
+# --------------------------------------------
+
+
+class AvcConfig:
+    """
+    Attributes:
+        length_size: An int containing the byte length of each NAL unit's size prefix
+        parameter_sets: A bytes object containing the SPS & PPS NAL units in Annex-B form
+    """
+
+    def __init__(self, avcc):
+        if len(avcc) < 7:
+            raise ValueError('AVC configuration record is too short')
+        self.length_size = (avcc[4] & 0x03) + 1
+        sets = []
+        position = 5
+        # SPS count is the low 5 bits, PPS count a whole byte
+        for count_mask in (0x1F, 0xFF):
+            count = avcc[position] & count_mask
+            position = position + 1
+            for _ in range(count):
+                length = struct.unpack('>H', avcc[position:position + 2])[0]
+                sets.append(ANNEXB_START_CODE + avcc[position + 2:position + 2 + length])
+                position = position + 2 + length
+        self.parameter_sets = b''.join(sets)
+
+    def to_annexb(self, sample):
+        # swap each length prefix for a start code
+        nal_units = []
+        position = 0
+        while position + self.length_size <= len(sample):
+            length = int.from_bytes(sample[position:position + self.length_size], 'big')
+            position = position + self.length_size
+            nal_units.append(ANNEXB_START_CODE + sample[position:position + length])
+            position = position + length
+        return b''.join(nal_units)
+
+
+class PipeStream:
+    """
+    Feeds the Annex-B H.264 track of a container to a reader through a named pipe, so nothing is written to disk.
+
+    Attributes:
+        file_name: A string containing the container file name
+        path: A string containing the named pipe path (relative, so wine can resolve it)
+        error: The exception that stopped the demuxer, or None
+        opened: A bool, True once the reader has opened the pipe
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.path = 'temp-stream-{}.h264'.format(uuid.uuid4().hex)
+        self.error = None
+        self.opened = False
+        self.stopped = threading.Event()
+        os.mkfifo(self.path)
+        self.thread = threading.Thread(target=self.feed, daemon=True)
+        self.thread.start()
+
+    def open_pipe(self):
+        # a non-blocking open fails until the reader opens its end, which lets close() stop a writer left waiting
+        while not self.stopped.is_set():
+            try:
+                pipe = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                self.stopped.wait(PIPE_OPEN_POLL)
+                continue
+            os.set_blocking(pipe, True)
+            self.opened = True
+            return pipe
+        return None
+
+    def feed(self):
+        pipe = self.open_pipe()
+        if pipe is None:
+            return
+        try:
+            with os.fdopen(pipe, 'wb') as pipe_file:
+                for chunk in iter_annexb(self.file_name):
+                    if self.stopped.is_set():
+                        break
+                    pipe_file.write(chunk)
+        except BrokenPipeError:
+            pass  # the reader stopped early
+        except Exception as error:
+            self.error = error
+
+    def check(self):
+        # called once the extractor has exited - the demuxer only sets error after closing the pipe, so wait for it
+        if not self.opened:
+            self.stopped.set()
+        self.thread.join(PIPE_FINISH_TIMEOUT)
+        if self.error is not None:
+            raise ValueError('Could not demux {}: {}'.format(self.file_name, self.error))
+        if not self.opened:
+            raise ValueError('The extractor never read the demuxed stream of {}'.format(self.file_name))
+        if self.thread.is_alive():
+            raise ValueError('Demuxing {} did not finish'.format(self.file_name))
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join(PIPE_OPEN_POLL * 10)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# --------------------------------------------
+
+# FUNCTIONS - ISO BMFF (MP4)
+
+# --------------------------------------------
+
+
+# FUNCTION: ITERATE BOXES BETWEEN TWO OFFSETS -> (type, payload offset, box end)
+def iter_boxes(stream, start, end):
+    position = start
+    while position + 8 <= end:
+        stream.seek(position)
+        size, box_type = struct.unpack('>I4s', stream.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', stream.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            raise ValueError('Corrupt box {} at {}'.format(box_type, position))
+        yield box_type, position + header, position + size
+        position = position + size
+
+
+# FUNCTION: FIND A CHILD BOX -> (payload offset, box end) OR NONE
+def find_box(stream, start, end, box_type):
+    for child_type, payload, box_end in iter_boxes(stream, start, end):
+        if child_type == box_type:
+            return payload, box_end
+    return None
+
+
+# FUNCTION: READ A BOX'S PAYLOAD
+def read_box(stream, box):
+    if box is None:
+        raise ValueError('Missing sample table box')
+    stream.seek(box[0])
+    return stream.read(box[1] - box[0])
+
+
+# FUNCTION: FIND THE SAMPLE TABLE & AVC CONFIG OF THE FIRST H.264 VIDEO TRACK
+def find_mp4_avc_track(stream, file_size):
+    moov = find_box(stream, 0, file_size, b'moov')
+    if moov is None:
+        raise ValueError('No moov box')
+    for box_type, payload, box_end in iter_boxes(stream, moov[0], moov[1]):
+        if box_type != b'trak':
+            continue
+        mdia = find_box(stream, payload, box_end, b'mdia')
+        hdlr = mdia and find_box(stream, mdia[0], mdia[1], b'hdlr')
+        if hdlr is None or read_box(stream, hdlr)[8:12] != b'vide':
+            continue
+        minf = find_box(stream, mdia[0], mdia[1], b'minf')
+        stbl = minf and find_box(stream, minf[0], minf[1], b'stbl')
+        stsd = stbl and find_box(stream, stbl[0], stbl[1], b'stsd')
+        if stsd is None:
+            continue
+        # stsd: version/flags & entry count, then sample entries
+        for entry_type, entry_payload, entry_end in iter_boxes(stream, stsd[0] + 8, stsd[1]):
+            if entry_type in MP4_AVC_ENTRIES:
+                # visual sample entry fields take 78 bytes before the child boxes
+                avcc = find_box(stream, entry_payload + 78, entry_end, b'avcC')
+                if avcc is not None:
+                    return stbl, AvcConfig(read_box(stream, avcc))
+    raise ValueError('No H.264 video track')
+
+
+# FUNCTION: READ AN ARRAY OF BIG-ENDIAN INTS FROM A FULL BOX -> LIST
+def read_table(data, offset, count, item_format):
+    item_size = struct.calcsize('>' + item_format)
+    return list(struct.unpack('>{}{}'.format(count, item_format), data[offset:offset + count * item_size]))
+
+
+# FUNCTION: GET (OFFSET, SIZE, IS SYNC) FOR EVERY SAMPLE OF A TRACK
+def mp4_sample_table(stream, stbl):
+    stsz = read_box(stream, find_box(stream, stbl[0], stbl[1], b'stsz'))
+    sample_size, sample_count = struct.unpack('>II', stsz[4:12])
+    sizes = read_table(stsz, 12, sample_count, 'I') if sample_size == 0 else [sample_size] * sample_count
+
+    stsc = read_box(stream, find_box(stream, stbl[0], stbl[1], b'stsc'))
+    stsc_count = struct.unpack('>I', stsc[4:8])[0]
+    stsc_entries = read_table(stsc, 8, stsc_count * 3, 'I')
+
+    stco = find_box(stream, stbl[0], stbl[1], b'stco')
+    if stco is not None:
+        stco = read_box(stream, stco)
+        chunk_offsets = read_table(stco, 8, struct.unpack('>I', stco[4:8])[0], 'I')
+    else:
+        co64 = read_box(stream, find_box(stream, stbl[0], stbl[1], b'co64'))
+        chunk_offsets = read_table(co64, 8, struct.unpack('>I', co64[4:8])[0], 'Q')
+
+    # no stss box means every sample is a sync sample
+    stss = find_box(stream, stbl[0], stbl[1], b'stss')
+    sync_samples = None
+    if stss is not None:
+        stss = read_box(stream, stss)
+        sync_samples = set(read_table(stss, 8, struct.unpack('>I', stss[4:8])[0], 'I'))
+
+    samples = []
+    sample_number = 0
+    for run in range(stsc_count):
+        first_chunk, samples_per_chunk = stsc_entries[run * 3], stsc_entries[run * 3 + 1]
+        last_chunk = stsc_entries[(run + 1) * 3] - 1 if run + 1 < stsc_count else len(chunk_offsets)
+        for chunk in range(first_chunk, last_chunk + 1):
+            if not 0 < chunk <= len(chunk_offsets):
+                raise ValueError('Sample table refers to missing chunk {}'.format(chunk))
+            offset = chunk_offsets[chunk - 1]
+            for _ in range(samples_per_chunk):
+                if sample_number >= sample_count:
+                    return samples
+                size = sizes[sample_number]
+                sample_number = sample_number + 1
+                samples.append((offset, size, sync_samples is None or sample_number in sync_samples))
+                offset = offset + size
+    return samples
+
+
+# FUNCTION: STREAM AN MP4'S H.264 TRACK AS ANNEX-B CHUNKS
+def iter_mp4_annexb(file_name):
+    with open(file_name, 'rb') as stream:
+        file_size = os.fstat(stream.fileno()).st_size
+        stbl, config = find_mp4_avc_track(stream, file_size)
+        samples = mp4_sample_table(stream, stbl)
+        if not samples:
+            raise ValueError('No samples in moov (fragmented MP4 is not supported)')
+        first = True
+        for offset, size, is_sync in samples:
+            stream.seek(offset)
+            sample = config.to_annexb(stream.read(size))
+            # repeat SPS & PPS at each keyframe so every GOP decodes on its own
+            if first or is_sync:
+                sample = config.parameter_sets + sample
+                first = False
+            yield sample
+
+
+# --------------------------------------------
+
+# FUNCTIONS - MATROSKA (MKV)
+
+# --------------------------------------------
+
+
+# FUNCTION: READ AN EBML VARIABLE LENGTH INT FROM A FILE -> (value, length) OR (NONE, 0) AT EOF
+def read_vint(stream, keep_marker=False):
+    first = stream.read(1)
+    if not first:
+        return None, 0
+    # the number of leading zero bits gives the number of extra bytes
+    extra = max(0, 8 - first[0].bit_length())
+    return read_vint_bytes(first + stream.read(extra), 0, keep_marker)
+
+
+# FUNCTION: READ AN EBML ELEMENT HEADER -> (id, size OR NONE IF UNKNOWN) OR (NONE, NONE) AT EOF
+def read_element_header(stream):
+    element_id, id_length = read_vint(stream, keep_marker=True)
+    if element_id is None:
+        return None, None
+    size, size_length = read_vint(stream)
+    if size is None:
+        return None, None
+    # all size bits set means unknown size (e.g. live-written segments & clusters)
+    if size == (1 << (7 * size_length)) - 1:
+        size = None
+    return element_id, size
+
+
+# FUNCTION: READ CHILD ELEMENTS FROM BYTES -> { id : [payload] }
+def read_children(data):
+    children = {}
+    position = 0
+    while position < len(data):
+        element_id, id_length = read_vint_bytes(data, position, keep_marker=True)
+        size, size_length = read_vint_bytes(data, position + id_length)
+        start = position + id_length + size_length
+        children.setdefault(element_id, []).append(data[start:start + size])
+        position = start + size
+    return children
+
+
+# FUNCTION: READ AN EBML VARIABLE LENGTH INT FROM BYTES -> (value, length)
+def read_vint_bytes(data, position, keep_marker=False):
+    first = data[position]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length = length + 1
+        mask = mask >> 1
+    if length > 8:
+        raise ValueError('Invalid EBML variable length int')
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[position + 1:position + length]:
+        value = (value << 8) | byte
+    return value, length
+
+
+# FUNCTION: FIND THE H.264 VIDEO TRACK IN A TRACKS ELEMENT -> (track number, AvcConfig) OR NONE
+def find_mkv_avc_track(tracks_data):
+    for entry in read_children(tracks_data).get(MKV_TRACK_ENTRY, []):
+        fields = read_children(entry)
+        track_type = int.from_bytes(fields.get(MKV_TRACK_TYPE, [b'\x00'])[0], 'big')
+        codec_id = fields.get(MKV_CODEC_ID, [b''])[0].decode('ascii', 'ignore').rstrip('\x00')
+        if track_type == MKV_VIDEO_TRACK and codec_id == MKV_AVC_CODEC and MKV_CODEC_PRIVATE in fields:
+            track_number = int.from_bytes(fields[MKV_TRACK_NUMBER][0], 'big')
+            return track_number, AvcConfig(fields[MKV_CODEC_PRIVATE][0])
+    return None
+
+
+# FUNCTION: STREAM AN MKV'S H.264 TRACK AS ANNEX-B CHUNKS
+def iter_mkv_annexb(file_name):
+    with open(file_name, 'rb') as stream:
+        track = None
+        first = True
+        # walk elements flat, reading into master elements, so unknown-size clusters need no special handling
+        while True:
+            element_id, size = read_element_header(stream)
+            if element_id is None:
+                break
+            if element_id in MKV_MASTER_ELEMENTS:
+                continue
+            if size is None:
+                raise ValueError('Unknown-size element {:X} is not supported'.format(element_id))
+            if element_id == MKV_TRACKS:
+                track = find_mkv_avc_track(stream.read(size))
+                if track is None:
+                    raise ValueError('No H.264 video track')
+            elif element_id in (MKV_SIMPLE_BLOCK, MKV_BLOCK) and track is not None:
+                block = stream.read(size)
+                track_number, track_length = read_vint_bytes(block, 0)
+                if track_number != track[0]:
+                    continue
+                flags = block[track_length + 2]
+                if flags & 0x06:
+                    raise ValueError('Laced H.264 blocks are not supported')
+                sample = track[1].to_annexb(block[track_length + 3:])
+                # simple block keyframe flag - repeat SPS & PPS so every GOP decodes on its own
+                if first or (element_id == MKV_SIMPLE_BLOCK and flags & 0x80):
+                    sample = track[1].parameter_sets + sample
+                    first = False
+                yield sample
+            else:
+                stream.seek(size, os.SEEK_CUR)
+        if track is None:
+            raise ValueError('No tracks element')
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: GET CONTAINER FORMAT FROM MAGIC BYTES -> 'mp4', 'mkv' OR NONE
+def container_format(file_name):
+    with open(file_name, 'rb') as file:
+        header = file.read(8)
+    if header.startswith(MKV_MAGIC):
+        return 'mkv'
+    if header[4:8] in MP4_TOP_LEVEL_BOXES:
+        return 'mp4'
+    return None
+
+
+# FUNCTION: STREAM A CONTAINER'S H.264 TRACK AS ANNEX-B CHUNKS
+def iter_annexb(file_name):
+    container = container_format(file_name)
+    if container == 'mp4':
+        return iter_mp4_annexb(file_name)
+    if container == 'mkv':
+        return iter_mkv_annexb(file_name)
+    raise ValueError('Not an MP4 or Matroska file')
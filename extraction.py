@@ -0,0 +1,242 @@
+import os
+import os.path
+import time
+import pathlib
+import tempfile
+import json
+import re
+import math
+import fleep
+import magic
+import pandas
+from media_file import FARID_SCHEMA, NPELO_SCHEMA, FEATURE_DTYPE
+from gop_sampling import write_sampled_stream, estimate_frames
+from demux import PipeStream, container_format
+from extractor_policy import ExtractorError, FARID_POLICY, NPELO_POLICY, PARSE, run_extractor, with_retries
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+FARID_EXTRACTOR = './p2-img-feature-extraction.py'
+NPELO_EXTRACTOR = 'NPELO_extractor/extractor.exe'
+NPELO_GOP_LENGTH = 12
+
+
+# --------------------------------------------
+
+# CLASSES
+
+# --------------------------------------------
+
+
+class NpeloSource:
+    """
+    Attributes:
+        path: A string containing the file name to pass to the NPELO extractor
+        sample: A VideoSample object if only some GOPs are passed, else None
+        temp_file: A string containing a temp file to remove afterwards, or None
+        stream: A PipeStream object if a container is being demuxed into path, else None
+    """
+
+    def __init__(self, path, sample=None, temp_file=None, stream=None):
+        self.path = path
+        self.sample = sample
+        self.temp_file = temp_file
+        self.stream = stream
+
+    def check(self):
+        if self.stream is not None:
+            self.stream.check()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+        if self.temp_file is not None and os.path.exists(self.temp_file):
+            os.remove(self.temp_file)
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: BUILD FARID SUBPROCESS COMMAND
+def farid_command(file_name):
+    # pysteg is a python 2 package/collection and so needs to be run in p2
+    return [FARID_EXTRACTOR, 'farid', file_name]
+
+
+# FUNCTION: BUILD NPELO SUBPROCESS COMMAND
+def npelo_command(input_file, output_file):
+    return ['wine', NPELO_EXTRACTOR, '-s', '-t', str(NPELO_GOP_LENGTH), '-i', input_file, '-o', output_file]
+
+
+# FUNCTION: MAKE A UNIQUE NPELO OUTPUT FILE (SO EXTRACTORS CAN RUN SIDE BY SIDE)
+def npelo_temp_file():
+    # kept relative to the working directory so wine can resolve it
+    handle, path = tempfile.mkstemp(prefix='temp-features-', suffix='.csv', dir='.')
+    os.close(handle)
+    return os.path.basename(path)
+
+
+# FUNCTION: GET NPELO INPUT -> NpeloSource
+def npelo_input(file, sample_config=None):
+    # MP4 & Matroska are demuxed into a named pipe, as the extractor only reads raw H.264
+    if container_format(file.file_name) is not None:
+        stream = PipeStream(file.file_name)
+        return NpeloSource(stream.path, stream=stream)
+    # only raw H.264 bitstreams can be cut into GOP segments
+    if sample_config is not None and file.file_extension == 'h264':
+        sample_file, sample = write_sampled_stream(file.file_name, sample_config)
+        if sample_file is not None:
+            return NpeloSource(sample_file, sample=sample, temp_file=sample_file)
+    return NpeloSource(file.file_name)
+
+
+# FUNCTION: GET THE DEADLINE FOR ONE NPELO RUN (SECONDS)
+def npelo_deadline(file, source, policy):
+    # raw H.264 (whole or sampled) is timed by its frames, containers by their size
+    if source.stream is None and file.file_extension == 'h264':
+        return policy.deadline(os.path.getsize(source.path), estimate_frames(source.path))
+    return policy.deadline(os.path.getsize(file.file_name))
+
+
+# FUNCTION: RUN AN EXTRACTOR -> (stdout, seconds taken)
+def timed_extractor(command, policy, deadline):
+    started = time.monotonic()
+    stdout = run_extractor(command, policy, deadline)
+    return stdout, time.monotonic() - started
+
+
+# FUNCTION: PARSE EXTRACTOR OUTPUT, REPORTING ANY FAILURE AS A PARSE ERROR
+def parse_or_fail(parse, *args):
+    try:
+        return parse(*args)
+    except (ValueError, IndexError, OSError) as error:
+        raise ExtractorError(PARSE, str(error) or type(error).__name__)
+
+
+# FUNCTION: PARSE FARID SUBPROCESS OUTPUT INTO 108 FEATURES (R, G THEN B)
+def parse_farid_output(stdout):
+    # the first 254 chars of the output are not needed
+    decoded_stdout = stdout[254:].decode('utf-8')
+
+    # split output into strings per channel
+    segmented = decoded_stdout.split('\n')
+
+    # json.loads converts string representation of list into actual list object
+    farid_r = json.loads(segmented[0])
+    farid_g = json.loads(segmented[1])
+    farid_b = json.loads(segmented[2])
+
+    return farid_r + farid_g + farid_b
+
+
+# FUNCTION: GET NUMBER OF DECODED FRAMES FROM NPELO OUTPUT
+def parse_npelo_frames(stdout):
+    frames = 0
+    for line in stdout.decode('utf-8').splitlines():
+        if 'frames are decoded' in line:
+            frames = int(re.search(r'\d+', line).group())
+    return frames
+
+
+# FUNCTION: READ NPELO CSV INTO ONE ROW OF 36 FEATURES PER GOP
+def read_npelo_csv(output_file, frames):
+    if frames == 0:
+        raise ValueError('NPELO decoded no frames')
+    expected_lines = math.ceil(frames / NPELO_GOP_LENGTH)
+    temp_csv = pandas.read_csv(output_file, sep=' ', names=list(NPELO_SCHEMA.columns), index_col=False,
+                               dtype=FEATURE_DTYPE)
+    return temp_csv.values[:expected_lines]
+
+
+# FUNCTION: RUN NPELO ONCE -> (features, VideoSample OR NONE, seconds taken)
+def extract_npelo_once(file, sample_config, policy):
+    output_file = npelo_temp_file()
+    source = npelo_input(file, sample_config)
+    try:
+        if source.sample is not None:
+            print('... Sampling {} of ~{} GOP segments'.format(source.sample.segments, source.sample.total_segments))
+        if source.stream is not None:
+            print('... Demuxing H.264 track')
+        deadline = npelo_deadline(file, source, policy)
+        print('... Calling subprocess (deadline {:.0f}s)'.format(deadline))
+        output, seconds = timed_extractor(npelo_command(source.path, output_file), policy, deadline)
+        parse_or_fail(source.check)
+
+        print('... Handling frames')
+        features = parse_or_fail(read_npelo_csv, output_file, parse_npelo_frames(output))
+    finally:
+        # remove temp features csv & any sampled stream or pipe
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        source.close()
+    return features, source.sample, seconds
+
+
+# FUNCTION: GET NPELO FEATURES
+def get_npelo_features(file, sample_config=None, policy=NPELO_POLICY):
+    features, sample, seconds = with_retries(policy, file.file_name, extract_npelo_once, file, sample_config, policy)
+
+    # add features to file object
+    file.set_features(NPELO_SCHEMA, features)
+    file.sample = sample
+    file.extraction_time = seconds
+
+    return file
+
+
+# FUNCTION: RUN FARID ONCE -> (108 FEATURES, seconds taken)
+def extract_farid_once(file, policy):
+    deadline = policy.deadline(os.path.getsize(file.file_name))
+    stdout, seconds = timed_extractor(farid_command(file.file_name), policy, deadline)
+    return parse_or_fail(parse_farid_output, stdout), seconds
+
+
+# FUNCTION: GET FARID FEATURES (36 PER COLOUR CHANNEL)
+def get_farid_features(file, policy=FARID_POLICY):
+    features, seconds = with_retries(policy, file.file_name, extract_farid_once, file, policy)
+
+    # add features to file object - columns are r, g then b (see FARID_SCHEMA)
+    file.set_features(FARID_SCHEMA, features)
+    file.extraction_time = seconds
+
+    return file
+
+
+# FUNCTION: GET FILE TYPE OF INPUT FILE
+def get_file_type(file_name):
+    with open(file_name, 'rb') as file:
+        file_info = fleep.get(file.read(128))
+    if file_info.type_matches('raster-image') or file_info.type_matches('raw-image'):
+        file_type = 'image'
+        file_extension = file_info.extension[0]
+    elif file_info.type_matches('video'):
+        file_type = 'video'
+        file_extension = file_info.extension[0]
+    else:
+        h264_flag = 'H.264'
+        magic_info = magic.from_file(file_name)
+        if h264_flag in magic_info:
+            file_type = 'video'
+            file_extension = 'h264'
+        else:
+            file_type = 'other'
+            file_extension = pathlib.Path(file_name).suffix  # get file extension from pathlib instead
+    return file_type, file_extension
+
+
+# FUNCTION: FIND INPUT FILE IN FILESYSTEM
+def find_file(file_name):
+    if os.path.isfile(file_name):
+        return True
+    else:
+        return False
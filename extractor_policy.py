@@ -0,0 +1,234 @@
+import os
+import math
+import time
+import signal
+import asyncio
+import shutil
+import resource
+import subprocess
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+TIMEOUT = 'timeout'
+CRASH = 'crash'
+PARSE = 'parse'
+RETRYABLE = (TIMEOUT, CRASH)  # parse errors come from the input, so a retry would fail the same way
+MB = 1024 * 1024
+PRLIMIT = shutil.which('prlimit')  # util-linux, sets limits before exec so Wine's own children inherit them
+
+
+# --------------------------------------------
+
+# CLASSES
+
+# --------------------------------------------
+
+
+class ExtractorError(Exception):
+    """
+    Attributes:
+        kind: A string containing the type of failure (timeout, crash, parse)
+        message: A string describing the failure
+        attempts: An int containing the number of attempts made
+    """
+
+    def __init__(self, kind, message, attempts=1):
+        super().__init__(kind, message)
+        self.kind = kind
+        self.message = message
+        self.attempts = attempts
+
+    def __str__(self):
+        attempts = ' after {} attempts'.format(self.attempts) if self.attempts > 1 else ''
+        return '{}: {}{}'.format(self.kind, self.message, attempts)
+
+
+class ExtractorPolicy:
+    """
+    Attributes:
+        timeout: A float containing the base seconds allowed per file
+        timeout_per_mb: A float containing the seconds added per MB of input
+        timeout_per_frame: A float containing the seconds added per video frame, used instead of size when known
+        max_timeout: A float containing the most seconds allowed per attempt, or None for no cap
+        memory: An int containing the data segment limit per extractor process in MB, or None for no limit
+        retries: An int containing the most retries after a timeout or crash
+        backoff: A float containing the seconds before the first retry, doubling after each one
+        max_backoff: A float containing the longest wait between retries
+    """
+
+    def __init__(self, timeout, timeout_per_mb, timeout_per_frame=None, max_timeout=None, memory=None, retries=1,
+                 backoff=2, max_backoff=30):
+        self.timeout = timeout
+        self.timeout_per_mb = timeout_per_mb
+        self.timeout_per_frame = timeout_per_frame
+        self.max_timeout = max_timeout
+        self.memory = memory
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def adjusted(self, scale=1.0, retries=None, memory=None, max_timeout=None):
+        # memory or max_timeout of 0 removes the limit, None keeps this policy's
+        if max_timeout is None:
+            max_timeout = None if self.max_timeout is None else self.max_timeout * scale
+        return ExtractorPolicy(self.timeout * scale, self.timeout_per_mb * scale,
+                               None if self.timeout_per_frame is None else self.timeout_per_frame * scale,
+                               max_timeout or None, self.memory if memory is None else (memory or None),
+                               self.retries if retries is None else retries, self.backoff, self.max_backoff)
+
+    def deadline(self, input_size, frames=None):
+        if frames is not None and self.timeout_per_frame is not None:
+            seconds = self.timeout + frames * self.timeout_per_frame
+        else:
+            seconds = self.timeout + input_size / MB * self.timeout_per_mb
+        if self.max_timeout is not None:
+            seconds = min(seconds, self.max_timeout)
+        return seconds
+
+    def backoff_delay(self, attempt):
+        return min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+
+    def should_retry(self, error, attempt):
+        return error.kind in RETRYABLE and attempt <= self.retries
+
+    def resource_limits(self, deadline):
+        # -> [(prlimit option, resource limit, soft, hard)]
+        cpu_seconds = int(math.ceil(deadline))
+        # the CPU limit stops a spinning extractor even if this process is not there to kill it
+        limits = [('--cpu', resource.RLIMIT_CPU, cpu_seconds, cpu_seconds + 5)]
+        if self.memory is not None:
+            # RLIMIT_DATA rather than RLIMIT_AS, as Wine reserves far more address space than it uses
+            limits.append(('--data', resource.RLIMIT_DATA, self.memory * MB, self.memory * MB))
+        return limits
+
+    def limited_command(self, command, deadline):
+        # limits are set by prlimit (which then execs the extractor) rather than a preexec_fn, which can
+        # deadlock when this process has threads
+        if PRLIMIT is None:
+            return command
+        options = ['{}={}:{}'.format(option, soft, hard) for option, _, soft, hard in self.resource_limits(deadline)]
+        return [PRLIMIT] + options + ['--'] + list(command)
+
+    def apply_limits(self, pid, deadline):
+        # without the prlimit command, limit the extractor as soon as it has started instead
+        if PRLIMIT is not None or not hasattr(resource, 'prlimit'):
+            return
+        for _, limit, soft, hard in self.resource_limits(deadline):
+            try:
+                resource.prlimit(pid, limit, (soft, hard))
+            except ProcessLookupError:
+                return  # already exited
+
+
+FARID_POLICY = ExtractorPolicy(timeout=30, timeout_per_mb=15, max_timeout=600, memory=2048)
+# not capped, as long videos need the full frame-scaled deadline
+NPELO_POLICY = ExtractorPolicy(timeout=60, timeout_per_mb=10, timeout_per_frame=0.05, memory=4096)
+EXTRACTOR_POLICIES = {'farid': FARID_POLICY, 'npelo': NPELO_POLICY}
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: KILL AN EXTRACTOR & EVERYTHING IT STARTED (E.G. WINE CHILDREN)
+def kill_process_group(process):
+    # each extractor leads its own session, so this misses wineserver (it detaches itself) & other extractors
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+# FUNCTION: DESCRIBE HOW AN EXTRACTOR EXITED
+def exit_description(returncode):
+    if returncode < 0:
+        try:
+            return 'killed by {}'.format(signal.Signals(-returncode).name)
+        except ValueError:
+            return 'killed by signal {}'.format(-returncode)
+    return 'exited with {}'.format(returncode)
+
+
+# FUNCTION: RUN AN EXTRACTOR WITH A DEADLINE & RESOURCE LIMITS -> stdout
+def run_extractor(command, policy, deadline):
+    process = subprocess.Popen(policy.limited_command(command, deadline), stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, start_new_session=True)
+    try:
+        policy.apply_limits(process.pid, deadline)
+        stdout, _ = process.communicate(timeout=deadline)
+    except subprocess.TimeoutExpired:
+        kill_process_group(process)
+        process.communicate()
+        raise ExtractorError(TIMEOUT, 'no result within {:.0f}s'.format(deadline))
+    except BaseException:
+        kill_process_group(process)
+        process.wait()
+        raise
+    # clear up anything left running in the group
+    kill_process_group(process)
+    if process.returncode != 0:
+        raise ExtractorError(CRASH, exit_description(process.returncode))
+    return stdout
+
+
+# FUNCTION: RUN AN EXTRACTOR WITH A DEADLINE & RESOURCE LIMITS IN THE EVENT LOOP -> stdout
+async def run_extractor_async(command, policy, deadline):
+    process = await asyncio.create_subprocess_exec(*policy.limited_command(command, deadline),
+                                                   stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+                                                   start_new_session=True)
+    try:
+        policy.apply_limits(process.pid, deadline)
+        stdout, _ = await asyncio.wait_for(process.communicate(), deadline)
+    except asyncio.TimeoutError:
+        kill_process_group(process)
+        await process.wait()
+        raise ExtractorError(TIMEOUT, 'no result within {:.0f}s'.format(deadline))
+    except BaseException:
+        kill_process_group(process)
+        await process.wait()
+        raise
+    kill_process_group(process)
+    if process.returncode != 0:
+        raise ExtractorError(CRASH, exit_description(process.returncode))
+    return stdout
+
+
+# FUNCTION: CALL AN EXTRACTION, RETRYING TIMEOUTS & CRASHES WITH BACKOFF
+def with_retries(policy, file_name, extract, *args):
+    attempt = 1
+    while True:
+        try:
+            return extract(*args)
+        except ExtractorError as error:
+            error.attempts = attempt
+            if not policy.should_retry(error, attempt):
+                raise
+            delay = policy.backoff_delay(attempt)
+            print('[!] {} ({}), retrying in {:.0f}s'.format(file_name, error, delay))
+            time.sleep(delay)
+            attempt = attempt + 1
+
+
+# FUNCTION: AWAIT AN EXTRACTION, RETRYING TIMEOUTS & CRASHES WITH BACKOFF
+async def with_retries_async(policy, file_name, extract, *args):
+    attempt = 1
+    while True:
+        try:
+            return await extract(*args)
+        except ExtractorError as error:
+            error.attempts = attempt
+            if not policy.should_retry(error, attempt):
+                raise
+            delay = policy.backoff_delay(attempt)
+            print('[!] {} ({}), retrying in {:.0f}s'.format(file_name, error, delay))
+            await asyncio.sleep(delay)
+            attempt = attempt + 1
@@ -0,0 +1,262 @@
+import os
+import math
+import mmap
+import random
+import tempfile
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+START_CODE = b'\x00\x00\x01'
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+PREFIX_NAL_TYPES = (NAL_SEI, NAL_SPS, NAL_PPS, NAL_AUD)  # may sit in front of a random access point
+I_SLICE_TYPES = (2, 4, 7, 9)  # I & SI slices
+FRAME_COUNT_WINDOW = 8 * 1024 * 1024  # bytes read to estimate a frame count
+
+
+# --------------------------------------------
+
+# CLASSES
+
+# --------------------------------------------
+
+
+class SampleConfig:
+    """
+    Attributes:
+        budget: A float containing the fraction (< 1) or count (>= 1) of GOP segments to analyse
+        mode: A string containing how segments are picked (even, random)
+        seed: An int containing the seed for random picks
+        escalate: A bool for whether a suspicious sample triggers a full scan
+        spread: A float containing the assumed fraction of segments a payload touches, for the miss estimate
+    """
+
+    def __init__(self, budget, mode='even', seed=None, escalate=False, spread=0.05):
+        self.budget = budget
+        self.mode = mode
+        self.seed = seed
+        self.escalate = escalate
+        self.spread = spread
+
+    def segment_count(self, total_segments):
+        if self.budget < 1:
+            return max(1, int(math.ceil(self.budget * total_segments)))
+        return int(self.budget)
+
+
+class VideoSample:
+    """
+    Attributes:
+        segments: An int containing the number of GOP segments analysed
+        total_segments: An int containing the estimated number of GOP segments in the video
+        miss_probability: A float containing the estimated chance the sample missed a payload
+        escalated: A bool for whether a full scan replaced the sample
+    """
+
+    __slots__ = ('segments', 'total_segments', 'miss_probability', 'escalated')
+
+    def __init__(self, segments, total_segments, miss_probability):
+        self.segments = segments
+        self.total_segments = total_segments
+        self.miss_probability = miss_probability
+        self.escalated = False
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: FIND NEXT NAL UNIT -> (start code offset, payload offset) OR NONE
+def next_nal(data, offset, end=None):
+    end = len(data) if end is None else end
+    position = data.find(START_CODE, offset, end)
+    if position < 0:
+        return None
+    payload = position + len(START_CODE)
+    # 4 byte start codes have an extra leading zero
+    if position > offset and data[position - 1] == 0:
+        position = position - 1
+    return position, payload
+
+
+# FUNCTION: READ AN UNSIGNED EXP-GOLOMB VALUE -> (value, bit position)
+def read_ue(data, bit):
+    zeros = 0
+    while not (data[bit // 8] >> (7 - bit % 8)) & 1:
+        zeros = zeros + 1
+        bit = bit + 1
+    bit = bit + 1
+    value = 0
+    for _ in range(zeros):
+        value = (value << 1) | ((data[bit // 8] >> (7 - bit % 8)) & 1)
+        bit = bit + 1
+    return (1 << zeros) - 1 + value, bit
+
+
+# FUNCTION: CHECK IF A SLICE NAL STARTS A NEW IDR OR INTRA PICTURE
+def is_random_access(data, payload, nal_type):
+    if nal_type not in (NAL_SLICE, NAL_IDR):
+        return False
+    # first_mb_in_slice & slice_type are the first two fields after the 1 byte NAL header
+    header = bytes(data[payload + 1:payload + 9])
+    try:
+        first_mb, bit = read_ue(header, 0)
+        slice_type, _ = read_ue(header, bit)
+    except IndexError:
+        return False
+    # later slices of the same picture have first_mb_in_slice > 0
+    return first_mb == 0 and (nal_type == NAL_IDR or slice_type in I_SLICE_TYPES)
+
+
+# FUNCTION: CHECK IF A SLICE NAL IS THE FIRST SLICE OF A PICTURE
+def starts_picture(data, payload, nal_type):
+    if nal_type not in (NAL_SLICE, NAL_IDR) or payload + 1 >= len(data):
+        return False
+    # first_mb_in_slice is 0, which exp-golomb codes as a single 1 bit
+    return data[payload + 1] & 0x80 != 0
+
+
+# FUNCTION: FIND THE NEXT RANDOM ACCESS POINT AT OR AFTER OFFSET -> SEGMENT START OR NONE
+def next_segment_start(data, offset, skip_first_picture=False):
+    prefix_start = None
+    seen_picture = not skip_first_picture
+    nal = next_nal(data, offset)
+    while nal is not None:
+        position, payload = nal
+        if payload >= len(data):
+            return None
+        nal_type = data[payload] & 0x1F
+        if nal_type in PREFIX_NAL_TYPES:
+            if prefix_start is None:
+                prefix_start = position
+        elif seen_picture and is_random_access(data, payload, nal_type):
+            return prefix_start if prefix_start is not None else position
+        else:
+            prefix_start = None
+            if nal_type in (NAL_SLICE, NAL_IDR):
+                seen_picture = True
+        nal = next_nal(data, payload)
+    return None
+
+
+# FUNCTION: GET PARAMETER SETS (SPS & PPS) FROM THE START OF THE STREAM
+def parameter_sets(data, limit=1 << 20):
+    sets = []
+    nal = next_nal(data, 0, min(len(data), limit))
+    while nal is not None:
+        position, payload = nal
+        nal_type = data[payload] & 0x1F
+        following = next_nal(data, payload)
+        end = following[0] if following is not None else len(data)
+        if nal_type in (NAL_SPS, NAL_PPS):
+            sets.append(bytes(data[position:end]))
+        elif nal_type in (NAL_SLICE, NAL_IDR):
+            break
+        nal = following
+    return b''.join(sets)
+
+
+# FUNCTION: ESTIMATE FRAMES IN A RAW H.264 STREAM FROM ITS FIRST FEW MB
+def estimate_frames(file_name, window=FRAME_COUNT_WINDOW):
+    file_size = os.path.getsize(file_name)
+    if file_size == 0:
+        return 0
+    with open(file_name, 'rb') as video_file:
+        data = video_file.read(window)
+    frames = 0
+    nal = next_nal(data, 0)
+    while nal is not None:
+        _, payload = nal
+        if payload < len(data) and starts_picture(data, payload, data[payload] & 0x1F):
+            frames = frames + 1
+        nal = next_nal(data, payload)
+    if file_size <= len(data):
+        return frames
+    return int(round(frames * file_size / len(data)))
+
+
+# FUNCTION: ESTIMATE CHANCE OF MISSING A PAYLOAD SPREAD OVER SOME SEGMENTS
+def miss_probability(sampled, total, spread):
+    # hypergeometric chance that none of the sampled segments is one of the affected ones
+    affected = max(1, int(math.ceil(spread * total)))
+    if sampled + affected > total:
+        return 0.0
+    probability = 1.0
+    for i in range(sampled):
+        probability = probability * (total - affected - i) / (total - i)
+    return probability
+
+
+# FUNCTION: PICK SEGMENT OFFSETS
+def pick_offsets(file_size, count, config):
+    if config.mode == 'random':
+        rng = random.Random(config.seed)
+        return sorted(rng.randrange(file_size) for _ in range(count))
+    return [int((i + 0.5) * file_size / count) for i in range(count)]
+
+
+# FUNCTION: WRITE A SAMPLED H.264 STREAM -> (temp file name, VideoSample) OR (NONE, NONE) FOR A FULL SCAN
+def write_sampled_stream(file_name, config):
+    file_size = os.path.getsize(file_name)
+    if file_size == 0:
+        return None, None
+    with open(file_name, 'rb') as video_file:
+        data = mmap.mmap(video_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # measure the first segment to estimate how many there are, without reading the whole file
+            first_start = next_segment_start(data, 0)
+            if first_start is None:
+                return None, None
+            second_start = next_segment_start(data, first_start, skip_first_picture=True)
+            if second_start is None:
+                return None, None
+            estimated_total = max(1, file_size // (second_start - first_start))
+            count = config.segment_count(estimated_total)
+            if count >= estimated_total:
+                return None, None
+
+            header = parameter_sets(data)
+            segments = []
+            for offset in pick_offsets(file_size, count, config):
+                start = next_segment_start(data, offset)
+                if start is None or (segments and start == segments[-1][0]):
+                    continue
+                end = next_segment_start(data, start, skip_first_picture=True)
+                segments.append((start, len(data) if end is None else end))
+
+            if not segments:
+                return None, None
+
+            handle, sample_file = tempfile.mkstemp(prefix='temp-sample-', suffix='.h264', dir='.')
+            with os.fdopen(handle, 'wb') as sample_stream:
+                for start, end in segments:
+                    # repeat the parameter sets so every segment decodes on its own
+                    sample_stream.write(header)
+                    sample_stream.write(data[start:end])
+        finally:
+            data.close()
+    # refine the estimate with the mean length of every segment read
+    mean_length = sum(end - start for start, end in segments) / len(segments)
+    estimated_total = max(len(segments), int(round(file_size / mean_length)))
+    sample = VideoSample(len(segments), estimated_total,
+                         miss_probability(len(segments), estimated_total, config.spread))
+    return os.path.basename(sample_file), sample
+
+
+# FUNCTION: CHECK IF A SAMPLED VIDEO LOOKS SUSPICIOUS ENOUGH FOR A FULL SCAN
+def needs_escalation(file, config):
+    return (config is not None and config.escalate and file.sample is not None and not file.sample.escalated
+            and 'stego' in file.classification.values())
@@ -0,0 +1,145 @@
+import csv
+import numpy
+import pandas
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+FEATURE_DTYPE = numpy.float32
+
+
+# --------------------------------------------
+
+# CLASSES
+
+# --------------------------------------------
+
+
+class FeatureSchema:
+    """
+    Column layout shared by every File holding one kind of feature.
+
+    Attributes:
+        name: A string containing the feature set name (farid, npelo)
+        columns: A tuple containing the column names, in array order
+    """
+
+    __slots__ = ('name', 'columns')
+
+    def __init__(self, name, columns):
+        self.name = name
+        self.columns = tuple(columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+
+FARID_SCHEMA = FeatureSchema('farid', ['farid_{}_{}'.format(channel, i + 1) for channel in 'rgb' for i in range(36)])
+NPELO_SCHEMA = FeatureSchema('npelo', ['NPELO_{}'.format(i + 1) for i in range(36)])
+
+
+class File:
+    """
+    Attributes:
+        file_name: A string containing the file name
+        file_type: A string containing the file type (image, video, other)
+        file_extension: A string containing the file extension
+        file_size: A float containing the size of the file in bytes
+        schema: The FeatureSchema describing the columns of features
+        features: A 2D float32 array of features -> one row per image, or one row per GOP for video
+        classification: A dict containing of structure { classifier : prediction, etc }
+        sample: A VideoSample object if only some GOPs of a video were analysed, else None
+        extraction_time: A float containing the seconds the feature extractor ran for, or None
+    """
+
+    __slots__ = ('file_name', 'file_type', 'file_extension', 'file_size', 'schema', 'features', 'classification',
+                 'sample', 'extraction_time')
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.file_type = ''
+        self.file_extension = ''
+        self.file_size = ''
+        self.schema = None
+        self.features = None
+        self.classification = {}
+        self.sample = None
+        self.extraction_time = None
+
+    def set_file_type(self, file_type):
+        self.file_type = file_type
+
+    def set_file_extension(self, file_extension):
+        self.file_extension = file_extension
+
+    def set_file_size(self, file_size):
+        self.file_size = file_size
+
+    def set_features(self, schema, features):
+        features = numpy.asarray(features, dtype=FEATURE_DTYPE)
+        self.schema = schema
+        self.features = features.reshape(-1, len(schema))
+
+    def update_file(self, file_type, file_extension, file_size):
+        self.file_type = file_type
+        self.file_extension = file_extension
+        self.file_size = file_size
+
+    def set_classification(self, classifier, prediction):
+        self.classification[classifier] = prediction
+
+    def row_names(self):
+        # video rows are named per GOP, as in the old {'<file>_f<n>': {...}} dicts
+        if self.file_type == 'video':
+            return ['{}_f{}'.format(self.file_name, i + 1) for i in range(len(self.features))]
+        return [self.file_name]
+
+    def to_dataframe(self):
+        return features_dataframe([self])
+
+    def to_rows(self, file_class):
+        for row_name, row in zip(self.row_names(), self.features):
+            row_dict = {'file_name': row_name}
+            # str() of a float32 gives its shortest round-trip form, not float64 noise digits
+            row_dict.update(zip(self.schema.columns, (str(value) for value in row)))
+            row_dict['class'] = file_class
+            yield row_dict
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: STACK FILES' FEATURES INTO ONE DATA FRAME, INDEXED BY ROW NAME, AS CLASSIFIERS WERE TRAINED ON
+def features_dataframe(files):
+    # files must share a schema - float64, as the old per-file dicts of python floats were
+    return pandas.DataFrame(numpy.vstack([file.features for file in files]).astype(numpy.float64),
+                            index=[row_name for file in files for row_name in file.row_names()],
+                            columns=list(files[0].schema.columns))
+
+
+# FUNCTION: WRITE LABELLED FILE FEATURES TO CSV
+def write_features_csv(output_file, stego_files, clean_files):
+    # set fieldnames from the schemas in use, in order of first appearance
+    fieldnames = ['file_name']
+    schemas = []
+    for file in list(stego_files) + list(clean_files):
+        if file.schema is not None and file.schema not in schemas:
+            schemas.append(file.schema)
+            fieldnames.extend(column for column in file.schema.columns if column not in fieldnames)
+    fieldnames.append('class')
+    with open(output_file, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+        for file_group, file_class in ((stego_files, 1), (clean_files, 0)):
+            for file in file_group:
+                if file.features is not None:
+                    writer.writerows(file.to_rows(file_class))
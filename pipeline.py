@@ -0,0 +1,198 @@
+import asyncio
+import os
+import time
+import os.path
+from media_file import FARID_SCHEMA, NPELO_SCHEMA
+from extraction import (farid_command, npelo_command, npelo_temp_file, npelo_input, npelo_deadline, parse_or_fail,
+                        parse_farid_output, parse_npelo_frames, read_npelo_csv)
+from extractor_policy import ExtractorError, EXTRACTOR_POLICIES, run_extractor_async, with_retries_async
+from gop_sampling import needs_escalation
+from classifiers import classify_files
+
+
+# --------------------------------------------
+
+# CLASSES
+
+# --------------------------------------------
+
+
+class PipelineLimits:
+    """
+    Attributes:
+        detect: An int containing the number of concurrent file type detections while planning (I/O)
+        farid: An int containing the number of concurrent Farid subprocesses (light CPU)
+        npelo: An int containing the number of concurrent Wine NPELO subprocesses (heavy CPU & RAM)
+        batch_size: An int containing the most files classified in one predict call
+        in_flight: An int containing the most files being extracted or waiting for an extractor at once
+    """
+
+    def __init__(self, detect=8, farid=8, npelo=2, batch_size=32, in_flight=None):
+        self.detect = detect
+        self.farid = farid
+        self.npelo = npelo
+        self.batch_size = batch_size
+        self.in_flight = in_flight or 4 * (detect + farid + npelo)
+
+
+class Pipeline:
+    """
+    Overlaps Farid & NPELO extraction and batched classification of planned jobs (already found & typed).
+
+    Attributes:
+        classifiers: A dict of structure { file_type : { classifier : model } }
+        limits: A PipelineLimits object
+        sample_config: A SampleConfig object for sampled video analysis, or None for full scans
+        policies: A dict of structure { extractor : ExtractorPolicy } for deadlines, limits & retries
+        results: An asyncio.Queue of extracted File objects waiting to be classified
+        errors: A dict of structure { file_name : error message }
+    """
+
+    def __init__(self, classifiers, limits, sample_config=None, policies=None):
+        self.classifiers = classifiers
+        self.limits = limits
+        self.sample_config = sample_config
+        self.policies = policies or EXTRACTOR_POLICIES
+        self.farid_semaphore = None
+        self.npelo_semaphore = None
+        self.in_flight = None
+        self.results = None
+        self.errors = {}
+
+    def start(self):
+        # created here rather than in __init__ so they belong to the running event loop
+        self.farid_semaphore = asyncio.Semaphore(self.limits.farid)
+        self.npelo_semaphore = asyncio.Semaphore(self.limits.npelo)
+        self.in_flight = asyncio.Semaphore(self.limits.in_flight)
+        self.results = asyncio.Queue()
+
+    async def extract_farid_once(self, file):
+        policy = self.policies['farid']
+        async with self.farid_semaphore:
+            # timed inside the semaphore, so waiting for a free extractor is not counted
+            started = time.monotonic()
+            stdout = await run_extractor_async(farid_command(file.file_name), policy,
+                                               policy.deadline(file.file_size))
+            seconds = time.monotonic() - started
+        return parse_or_fail(parse_farid_output, stdout), seconds
+
+    async def extract_farid(self, file):
+        features, seconds = await with_retries_async(self.policies['farid'], file.file_name, self.extract_farid_once,
+                                                     file)
+        file.set_features(FARID_SCHEMA, features)
+        file.extraction_time = seconds
+
+    async def extract_npelo_once(self, file, sample_config):
+        policy = self.policies['npelo']
+        loop = asyncio.get_event_loop()
+        # the pipe or sampled stream is only made once a slot is free, so queued videos hold neither
+        async with self.npelo_semaphore:
+            output_file = npelo_temp_file()
+            source = await loop.run_in_executor(None, npelo_input, file, sample_config)
+            try:
+                deadline = await loop.run_in_executor(None, npelo_deadline, file, source, policy)
+                started = time.monotonic()
+                stdout = await run_extractor_async(npelo_command(source.path, output_file), policy, deadline)
+                seconds = time.monotonic() - started
+                await loop.run_in_executor(None, parse_or_fail, source.check)
+                return parse_or_fail(read_npelo_csv, output_file, parse_npelo_frames(stdout)), source.sample, seconds
+            finally:
+                if os.path.exists(output_file):
+                    os.remove(output_file)
+                source.close()
+
+    async def extract_npelo(self, file, sample_config=None):
+        features, sample, seconds = await with_retries_async(self.policies['npelo'], file.file_name,
+                                                             self.extract_npelo_once, file, sample_config)
+        file.set_features(NPELO_SCHEMA, features)
+        file.sample = sample
+        file.extraction_time = seconds
+
+    async def escalate(self, file):
+        # classify the sample straight away, & scan the whole video if it looks suspicious
+        await asyncio.get_event_loop().run_in_executor(None, classify_files, [file], self.classifiers)
+        if needs_escalation(file, self.sample_config):
+            print('[*] Suspicious sample, scanning all of: {}'.format(file.file_name))
+            sample = file.sample
+            try:
+                await self.extract_npelo(file)
+                sample.escalated = True
+            except ExtractorError as error:
+                # keep the sample's classification, as the full scan could not add to it (as in --serial)
+                print('[!] Full scan failed: {} ({})'.format(file.file_name, error))
+            file.sample = sample
+
+    async def process(self, job):
+        try:
+            file = job.to_file()
+            print('[*] Extracting: {} ({})'.format(file.file_name, file.file_type))
+            if file.file_type == 'image':
+                await self.extract_farid(file)
+            elif file.file_type == 'video':
+                await self.extract_npelo(file, self.sample_config)
+                if file.sample is not None and self.sample_config.escalate:
+                    await self.escalate(file)
+            await self.results.put((job.position, file))
+        except (ExtractorError, OSError) as error:
+            # anything else is a bug, so is left to stop the run
+            print('[!] Failed: {} ({})'.format(job.file_name, error))
+            self.errors[job.file_name] = str(error)
+        finally:
+            self.in_flight.release()
+
+    async def classify(self):
+        classified = []
+        finished = False
+        while not finished:
+            batch = [await self.results.get()]
+            # take whatever else is already waiting, up to the batch size
+            while len(batch) < self.limits.batch_size and not self.results.empty():
+                batch.append(self.results.get_nowait())
+            if None in batch:
+                finished = True
+                batch.remove(None)
+            if batch:
+                files = [file for _, file in batch]
+                await asyncio.get_event_loop().run_in_executor(None, classify_files, files, self.classifiers)
+                for _, file in batch:
+                    print('[*] Classified: {}'.format(file.file_name))
+                classified.extend(batch)
+        return classified
+
+    async def run(self, jobs):
+        self.start()
+        classifier_task = asyncio.ensure_future(self.classify())
+        tasks = []
+        for job in jobs:
+            if job.file_type == 'other':
+                continue  # not found, or not an image/video
+            # only start a file once there is room for it, so long lists are not all held in memory
+            await self.in_flight.acquire()
+            tasks.append(asyncio.ensure_future(self.process(job)))
+            tasks = [task for task in tasks if not task.done()]
+        await asyncio.gather(*tasks)
+        await self.results.put(None)
+        classified = await classifier_task
+        # keep input order for the classifications table
+        return [file for _, file in sorted(classified, key=lambda item: item[0])]
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: RUN PIPELINE OVER A LIST OF PLANNED JOBS, STARTED IN LIST ORDER
+def run_pipeline(jobs, classifiers, limits=None, sample_config=None, policies=None):
+    pipeline = Pipeline(classifiers, limits or PipelineLimits(), sample_config, policies)
+    loop = asyncio.new_event_loop()
+    # made current, as before Python 3.8 the child watcher needs it to start subprocesses
+    asyncio.set_event_loop(loop)
+    try:
+        file_list = loop.run_until_complete(pipeline.run(jobs))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+    return file_list, pipeline.errors
@@ -0,0 +1,279 @@
+import os
+import os.path
+import json
+import math
+import fcntl
+import heapq
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from media_file import File
+from extraction import get_file_type, find_file, NPELO_GOP_LENGTH
+from gop_sampling import estimate_frames
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+TIMING_HISTORY = './extraction-timings.json'
+ORDERS = ('longest', 'shortest', 'input')
+DETECT_WORKERS = 8
+MB = 1024 * 1024
+# what a worker needs of a planned job, written into spool batch files so files are only detected once
+JOB_RECORD = ('position', 'file_name', 'file_type', 'file_extension', 'file_size', 'kind', 'units')
+
+# cost kinds -> (unit, fixed seconds per run, starting seconds per unit, units of history the start is worth)
+COST_MODELS = {
+    'image': ('MB', 1.0, 2.0, 10),   # Farid, by file size
+    'h264': ('frames', 3.0, 0.02, 2000),  # NPELO on a raw H.264 stream, by frame count
+    'video': ('MB', 3.0, 1.0, 50),   # NPELO on a demuxed container, by file size
+}
+
+
+# --------------------------------------------
+
+# CLASSES
+
+# --------------------------------------------
+
+
+class TimingHistory:
+    """
+    Past extractor timings, kept in a local JSON file & used to refine cost estimates.
+
+    Attributes:
+        path: A string containing the history file path, or None (or empty) to not keep one
+        totals: A dict of structure { cost kind : { runs, seconds, units } } of every recorded run
+        added: The same for runs recorded since loading, merged into the file on save
+    """
+
+    def __init__(self, path=TIMING_HISTORY):
+        self.path = path
+        self.totals = {}
+        self.added = {}
+        if path and os.path.isfile(path):
+            with open(path, 'r') as history_file:
+                self.totals = json.load(history_file)
+
+    def rate(self, kind):
+        _, overhead, prior_rate, prior_units = COST_MODELS[kind]
+        totals = self.totals.get(kind, {'runs': 0, 'seconds': 0.0, 'units': 0.0})
+        # the starting rate counts as prior_units of history, so a few odd runs cannot swing it far
+        work_seconds = max(0.0, totals['seconds'] - totals['runs'] * overhead)
+        return (prior_rate * prior_units + work_seconds) / (prior_units + totals['units'])
+
+    def estimate(self, kind, units):
+        return COST_MODELS[kind][1] + self.rate(kind) * units
+
+    def record(self, kind, units, seconds):
+        for totals in (self.totals, self.added):
+            kind_totals = totals.setdefault(kind, {'runs': 0, 'seconds': 0.0, 'units': 0.0})
+            kind_totals['runs'] = kind_totals['runs'] + 1
+            kind_totals['seconds'] = kind_totals['seconds'] + seconds
+            kind_totals['units'] = kind_totals['units'] + units
+
+    def save(self):
+        if not self.path or not self.added:
+            return
+        # merge into the file as it is now, under a lock, so workers sharing it do not drop each other's runs
+        with open(self.path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            totals = {}
+            if os.path.isfile(self.path):
+                with open(self.path, 'r') as history_file:
+                    totals = json.load(history_file)
+            for kind, added in self.added.items():
+                kind_totals = totals.setdefault(kind, {'runs': 0, 'seconds': 0.0, 'units': 0.0})
+                for key in ('runs', 'seconds', 'units'):
+                    kind_totals[key] = kind_totals[key] + added[key]
+            handle, temp_path = tempfile.mkstemp(prefix='.timings-',
+                                                 dir=os.path.dirname(os.path.abspath(self.path)))
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump(totals, temp_file, indent=2)
+            os.replace(temp_path, self.path)
+        self.totals = totals
+        self.added = {}
+
+
+class Job:
+    """
+    Attributes:
+        file_name: A string containing the file name
+        position: An int containing the file's position in the input, which results are listed in
+        file_type: A string containing the file type (image, video, other)
+        file_extension: A string containing the file extension
+        file_size: An int containing the size of the file in bytes
+        kind: A string containing the cost kind (see COST_MODELS), or None for files that will be skipped
+        units: A float containing the work in the whole file, in the cost kind's unit
+        estimate: A float containing the estimated extractor seconds
+    """
+
+    __slots__ = ('file_name', 'position', 'file_type', 'file_extension', 'file_size', 'kind', 'units', 'estimate')
+
+    def __init__(self, file_name, position=0, file_type='other', file_extension='', file_size=0):
+        self.file_name = file_name
+        self.position = position
+        self.file_type = file_type
+        self.file_extension = file_extension
+        self.file_size = file_size
+        self.kind = None
+        self.units = 0
+        self.estimate = 0.0
+
+    def to_file(self):
+        # type & size were found while planning, so are not detected again
+        file = File(self.file_name)
+        file.update_file(self.file_type, self.file_extension, self.file_size)
+        return file
+
+    def to_record(self):
+        return {field: getattr(self, field) for field in JOB_RECORD}
+
+    def describe_units(self):
+        if self.kind is None:
+            return ''
+        unit = COST_MODELS[self.kind][0]
+        return '{:.0f} {}'.format(self.units, unit) if unit == 'frames' else '{:.2f} {}'.format(self.units, unit)
+
+
+class Schedule:
+    """
+    Attributes:
+        jobs: A list of Job objects, in the order they should be run
+        history: A TimingHistory object the estimates came from, & new timings go to
+        sample_config: A SampleConfig object for sampled video analysis, or None for full scans
+    """
+
+    def __init__(self, jobs, history, sample_config=None):
+        self.jobs = jobs
+        self.history = history
+        self.sample_config = sample_config
+
+    def file_names(self):
+        return [job.file_name for job in self.jobs]
+
+    def positions(self):
+        return {job.file_name: job.position for job in self.jobs}
+
+    def input_order(self):
+        return sorted(self.jobs, key=lambda job: job.position)
+
+    def total_estimate(self):
+        return sum(job.estimate for job in self.jobs)
+
+    def makespan(self, limits=None, jobs=None):
+        jobs = self.jobs if jobs is None else jobs
+        if limits is None:
+            return sum(job.estimate for job in jobs)
+        # images & videos use separate extractor pools, each handed work in list order
+        pools = {'image': limits.farid, 'video': limits.npelo}
+        finish = 0.0
+        for file_type, slots in pools.items():
+            free_at = [0.0] * max(1, slots)
+            for job in jobs:
+                if job.file_type == file_type:
+                    heapq.heappush(free_at, heapq.heappop(free_at) + job.estimate)
+            finish = max(finish, max(free_at))
+        return finish
+
+    def batches(self, batch_files):
+        # -> [[job record (see JOB_RECORD)]]
+        # aim for batches of equal cost, so a long file gets a batch of its own rather than holding up 499 others
+        batch_count = max(1, math.ceil(len(self.jobs) / batch_files))
+        target = self.total_estimate() / batch_count
+        batches = [[]]
+        batch_cost = 0.0
+        for job in self.jobs:
+            if batches[-1] and (len(batches[-1]) >= batch_files or batch_cost + job.estimate > target):
+                batches.append([])
+                batch_cost = 0.0
+            batches[-1].append(job.to_record())
+            batch_cost = batch_cost + job.estimate
+        return [batch for batch in batches if batch]
+
+    def record(self, file_list):
+        jobs = {job.file_name: job for job in self.jobs}
+        for file in file_list:
+            job = jobs.get(file.file_name)
+            if job is None or job.kind is None or file.extraction_time is None:
+                continue
+            units = job.units
+            if file.sample is not None and not file.sample.escalated:
+                units = units * file.sample.segments / max(1, file.sample.total_segments)
+            self.history.record(job.kind, units, file.extraction_time)
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: GET THE SHARE OF A VIDEO'S FRAMES A SAMPLE WILL COVER
+def sample_fraction(frames, sample_config):
+    if sample_config.budget < 1:
+        return sample_config.budget
+    return min(1.0, sample_config.budget * NPELO_GOP_LENGTH / max(1, frames))
+
+
+# FUNCTION: REBUILD A PLANNED JOB FROM ITS RECORD, WITHOUT DETECTING THE FILE AGAIN -> Job
+def job_from_record(record):
+    job = Job(record['file_name'], record['position'], record['file_type'], record['file_extension'],
+              record['file_size'])
+    job.kind = record['kind']
+    job.units = record['units']
+    return job
+
+
+# FUNCTION: DETECT ONE FILE & MEASURE ITS WORK -> Job
+def detect_job(file_name, position):
+    if not find_file(file_name):
+        return Job(file_name, position)
+    file_type, file_extension = get_file_type(file_name)
+    job = Job(file_name, position, file_type, file_extension, os.path.getsize(file_name))
+    if file_type == 'image':
+        job.kind = 'image'
+        job.units = job.file_size / MB
+    elif file_type == 'video' and file_extension == 'h264':
+        job.kind = 'h264'
+        job.units = estimate_frames(file_name)
+    elif file_type == 'video':
+        job.kind = 'video'
+        job.units = job.file_size / MB
+    return job
+
+
+# FUNCTION: ESTIMATE THE EXTRACTOR SECONDS FOR ONE JOB
+def estimate_job(job, history, sample_config=None):
+    if job.kind is None:
+        return 0.0
+    units = job.units
+    if sample_config is not None and job.kind == 'h264':
+        units = units * sample_fraction(units, sample_config)
+    return history.estimate(job.kind, units)
+
+
+# FUNCTION: ESTIMATE & ORDER DETECTED JOBS -> Schedule
+def schedule_jobs(jobs, history, sample_config=None, order='longest'):
+    for job in jobs:
+        job.estimate = estimate_job(job, history, sample_config)
+    # sorted() is stable, so equal estimates keep their input order
+    if order == 'longest':
+        jobs = sorted(jobs, key=lambda job: -job.estimate)
+    elif order == 'shortest':
+        jobs = sorted(jobs, key=lambda job: job.estimate)
+    else:
+        jobs = sorted(jobs, key=lambda job: job.position)
+    return Schedule(jobs, history, sample_config)
+
+
+# FUNCTION: DETECT, ESTIMATE & ORDER A LIST OF FILES -> Schedule
+def plan(file_names, history, sample_config=None, order='longest', workers=DETECT_WORKERS):
+    # detection is mostly waiting on reads, so files are detected side by side
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        jobs = list(executor.map(detect_job, file_names, range(len(file_names))))
+    return schedule_jobs(jobs, history, sample_config, order)
@@ -0,0 +1,232 @@
+import sys
+import os
+import io
+import time
+import argparse
+import numpy
+import pandas
+from sklearn.model_selection import StratifiedKFold, cross_validate
+from sklearn.pipeline import make_pipeline
+from sklearn import svm, preprocessing, linear_model
+import joblib
+from tabulate import tabulate
+from classifiers import CLASSIFIER_FILES, save_classifier
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+FEATURE_FILES = {'image': './img-features.csv', 'video': './vid-features.csv'}
+LATENCY_REPEATS = 20
+LATENCY_BATCH = 1024  # rows per predict call, as steganalyse.py classifies in batches
+LATENCY_TIE = 0.1  # candidates within 10% of the fastest are tied, & split on accuracy then size
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: GET CANDIDATE MODELS -> [(name, classifier slot, unfitted model)]
+def get_candidates(seed):
+    bases = [
+        ('SVC (linear)', 'svm', lambda: svm.SVC(kernel='linear')),
+        ('LinearSVC', 'svm', lambda: svm.LinearSVC(random_state=seed)),
+        ('SGD (hinge)', 'svm', lambda: linear_model.SGDClassifier(loss='hinge', random_state=seed)),
+        ('LR', 'lr', lambda: linear_model.LogisticRegression(random_state=seed)),
+    ]
+    candidates = []
+    for name, slot, make_model in bases:
+        candidates.append((name, slot, make_model()))
+        # scaling is saved inside the pipeline, so steganalyse.py gets scaled features at predict time too
+        candidates.append(('{} + scaling'.format(name), slot,
+                           make_pipeline(preprocessing.MinMaxScaler(feature_range=(0, 1)), make_model())))
+    return candidates
+
+
+# FUNCTION: READ CACHED FEATURES -> x, y, groups
+def read_features(file_type):
+    csv_file = FEATURE_FILES[file_type]
+    print('[*] Reading {} ... '.format(csv_file))
+    training_data = pandas.read_csv(csv_file)
+    x = training_data.drop(['file_name', 'class'], axis=1)
+    y = training_data['class']
+    if file_type == 'video':
+        # GOP rows are named <file>_f<n> - keep every GOP of a video in the same fold
+        groups = training_data['file_name'].str.rsplit('_f', n=1).str[0]
+    else:
+        groups = training_data['file_name']
+    return x, y, groups
+
+
+# FUNCTION: GET SEEDED CROSS-VALIDATION FOLDS
+def get_folds(file_type, folds, seed, x, y, groups):
+    if file_type == 'video':
+        return group_folds(folds, seed, y, groups)
+    return list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(x, y))
+
+
+# FUNCTION: GET SEEDED FOLDS THAT KEEP EVERY GOP OF A VIDEO TOGETHER
+def group_folds(folds, seed, y, groups):
+    # GroupKFold takes no seed, so deal shuffled videos out to the folds one class at a time (stratified)
+    rng = numpy.random.RandomState(seed)
+    video_classes = y.groupby(groups).max()
+    video_folds = {}
+    for video_class in sorted(video_classes.unique()):
+        videos = sorted(video_classes.index[video_classes == video_class])
+        rng.shuffle(videos)
+        for video in videos:
+            video_folds[video] = len(video_folds) % folds
+    row_folds = groups.map(video_folds).values
+    return [(numpy.flatnonzero(row_folds != fold), numpy.flatnonzero(row_folds == fold)) for fold in range(folds)]
+
+
+# FUNCTION: GET A SCORER FOR PER-VIDEO ACCURACY, WITH A VIDEO STEGO IF ANY OF ITS GOPS IS (AS IN classify_files)
+def video_accuracy(groups):
+    def score(model, x, y):
+        # x keeps the training data's row index, so each GOP can be traced back to its video
+        rows = pandas.DataFrame({'video': groups.loc[x.index].values, 'actual': numpy.asarray(y),
+                                 'predicted': model.predict(x)})
+        videos = rows.groupby('video').max()
+        return float((videos['actual'] == videos['predicted']).mean())
+
+    return score
+
+
+# FUNCTION: MEASURE PER-SAMPLE PREDICT LATENCY OVER A BATCH (MEDIAN, SECONDS)
+def predict_latency(model, x):
+    # a single-row predict is mostly pandas validation overhead, so time a batch & divide
+    batch = x.iloc[numpy.arange(LATENCY_BATCH) % len(x)]
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        start = time.perf_counter()
+        model.predict(batch)
+        timings.append(time.perf_counter() - start)
+    return float(numpy.median(timings)) / LATENCY_BATCH
+
+
+# FUNCTION: GET SERIALISED MODEL SIZE (BYTES)
+def serialised_size(model):
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell()
+
+
+# FUNCTION: BENCHMARK EVERY CANDIDATE FOR ONE FILE TYPE
+def benchmark_candidates(file_type, folds, seed, jobs):
+    x, y, groups = read_features(file_type)
+    cv_folds = get_folds(file_type, folds, seed, x, y, groups)
+    # videos are judged whole, as steganalyse.py classifies them - per-GOP accuracy hides false positives
+    scoring = video_accuracy(groups) if file_type == 'video' else 'accuracy'
+    results = []
+    for name, slot, model in get_candidates(seed):
+        print('[*] Cross-validating {} ... '.format(name))
+        scores = cross_validate(model, x, y, cv=cv_folds, scoring=scoring, n_jobs=jobs)
+        print('[*] Fitting {} on all data ... '.format(name))
+        model.fit(x, y)
+        results.append({
+            'model': name,
+            'slot': slot,
+            'accuracy': scores['test_score'].mean(),
+            'accuracy_std': scores['test_score'].std(),
+            'fit_time': scores['fit_time'].mean(),
+            'predict_latency': predict_latency(model, x),
+            'size': serialised_size(model),
+            'estimator': model,
+        })
+    return results
+
+
+# FUNCTION: PICK FASTEST MODEL PER SLOT ABOVE THE ACCURACY FLOOR (NEAR-TIES GO TO THE MORE ACCURATE, THEN SMALLER)
+# -> { slot : result, or None if nothing reaches the floor & below_floor is not set }
+def select_models(results, min_accuracy, below_floor=False):
+    chosen = {}
+    for slot in ('svm', 'lr'):
+        slot_results = [result for result in results if result['slot'] == slot]
+        eligible = [result for result in slot_results if result['accuracy'] >= min_accuracy]
+        if eligible:
+            fastest = min(result['predict_latency'] for result in eligible)
+            tied = [result for result in eligible if result['predict_latency'] <= fastest * (1 + LATENCY_TIE)]
+            chosen[slot] = min(tied, key=lambda result: (-result['accuracy'], result['size']))
+        elif below_floor:
+            # nothing is accurate enough, so fall back to the most accurate rather than the fastest
+            print('[!] No {} candidate reaches accuracy {} - using the most accurate'.format(slot, min_accuracy))
+            chosen[slot] = min(slot_results, key=lambda result: (-result['accuracy'], result['predict_latency']))
+        else:
+            print('[!] No {} candidate reaches accuracy {} - nothing chosen'.format(slot, min_accuracy))
+            chosen[slot] = None
+    return chosen
+
+
+# FUNCTION: OUTPUT & SAVE BENCHMARK TABLE
+def report_results(file_type, results, chosen):
+    cols = ['Model', 'Slot', 'Accuracy', 'Std', 'Fit time (s)', 'Predict latency (us)', 'Size (KB)', 'Chosen']
+    rows = []
+    for result in results:
+        rows.append([result['model'], result['slot'], result['accuracy'], result['accuracy_std'], result['fit_time'],
+                     result['predict_latency'] * 1000000, result['size'] / 1024,
+                     'yes' if chosen[result['slot']] is result else ''])
+    results_df = pandas.DataFrame(rows, columns=cols)
+    output_file = 'model-selection-{}.csv'.format(file_type)
+    results_df.to_csv(output_file, index=False)
+    print('\n=== Model selection for {} files ===\n'.format(file_type))
+    print(tabulate(results_df, headers=cols, tablefmt='psql', showindex=False, floatfmt='.4f'))
+    print('\nBenchmark results also saved to {}\n'.format(output_file))
+
+
+# FUNCTION: RUN PROGRAM -> False if a slot was left without a model (nothing reached the accuracy floor)
+def run(file_types, min_accuracy, folds, seed, jobs, save, below_floor=False):
+    all_chosen = True
+    for file_type in file_types:
+        print('\n===== BENCHMARKING {} CLASSIFIERS =====\n'.format(file_type.upper()))
+        results = benchmark_candidates(file_type, folds, seed, jobs)
+        chosen = select_models(results, min_accuracy, below_floor)
+        report_results(file_type, results, chosen)
+        for slot, result in chosen.items():
+            joblib_file = CLASSIFIER_FILES[file_type][slot]
+            if result is None:
+                # the production model is left as it is rather than replaced by a worse than acceptable one
+                all_chosen = False
+                print('[!] Keeping {} (use --save-below-floor to save the most accurate)'.format(joblib_file))
+            elif save:
+                print('[*] Saving {} as {} ... '.format(result['model'], joblib_file))
+                save_classifier(result['estimator'], joblib_file)
+    return all_chosen
+
+
+# MAIN FUNCTION: GLOBAL VARIABLES
+if __name__ == '__main__':
+    # argument parsing
+    parser = argparse.ArgumentParser(description='A script to benchmark candidate classifiers on the features cached '
+                                                 'by train-classifiers.py, & save the fastest accurate enough ones.')
+    parser.add_argument('-t', '--file-type', action='store', choices=['image', 'video', 'both'], default='both',
+                        help='Which classifiers to select (default: both)')
+    parser.add_argument('-a', '--min-accuracy', action='store', type=float, default=0.8,
+                        help='Lowest acceptable mean cross-validation accuracy (default: 0.8)')
+    parser.add_argument('-k', '--folds', action='store', type=int, default=5,
+                        help='Number of cross-validation folds (default: 5)')
+    parser.add_argument('-s', '--seed', action='store', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=-1,
+                        help='Parallel cross-validation jobs (default: all CPUs)')
+    parser.add_argument('--no-save', action='store_true', help='Only report, do not overwrite the .joblib files')
+    parser.add_argument('--save-below-floor', action='store_true',
+                        help='If no candidate reaches --min-accuracy, save the most accurate anyway (default: keep '
+                             'the current .joblib file & exit with an error)')
+    args = parser.parse_args()
+
+    # handle arguments
+    file_types = ['image', 'video'] if args.file_type == 'both' else [args.file_type]
+    for file_type in file_types:
+        if not os.path.isfile(FEATURE_FILES[file_type]):
+            print('{} not found! Run train-classifiers.py first.'.format(FEATURE_FILES[file_type]))
+            sys.exit(1)
+
+    if not run(file_types, args.min_accuracy, args.folds, args.seed, args.jobs, not args.no_save,
+               args.save_below_floor):
+        sys.exit(1)
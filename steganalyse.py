@@ -1,66 +1,18 @@
 import argparse
 import sys
+import time
 import warnings
 import os.path
-import fleep
-import pathlib
-import magic
 import subprocess
-import json
-import re
-import math
 import pandas
-import scipy.stats
-from sklearn import svm  # note: this is needed for the imported classifiers
-import joblib
 from tabulate import tabulate
-
-
-# --------------------------------------------
-
-# CLASSES
-
-# --------------------------------------------
-
-
-class File:
-    """
-    Attributes:
-        file_name: A string containing the file name
-        file_type: A string containing the file type (image, video, other)
-        file_extension: A string containing the file extension
-        file_size: A float containing the size of the file in bytes
-        features: A dict containing each type of feature from file for ML -> {feature_set_name: [features]}
-        classification: A dict containing of structure { classifier : prediction, etc }
-    """
-
-    def __init__(self, file_name):
-        self.file_name = file_name
-        self.file_type = ''
-        self.file_extension = ''
-        self.file_size = ''
-        self.features = {}
-        self.classification = {}
-
-    def set_file_type(self, file_type):
-        self.file_type = file_type
-
-    def set_file_extension(self, file_extension):
-        self.file_extension = file_extension
-
-    def set_file_size(self, file_size):
-        self.file_size = file_size
-
-    def add_features(self, feature_source, feature_list):
-        self.features[feature_source] = feature_list
-
-    def update_file(self, file_type, file_extension, file_size):
-        self.file_type = file_type
-        self.file_extension = file_extension
-        self.file_size = file_size
-
-    def set_classification(self, classifier, prediction):
-        self.classification[classifier] = prediction
+from extraction import get_farid_features, get_npelo_features
+from classifiers import classifiers_found, load_classifiers, classify_files
+from pipeline import PipelineLimits, run_pipeline
+from gop_sampling import SampleConfig, needs_escalation
+from work_queue import Spool, ForkedWorker, can_fork, worker_id
+from extractor_policy import ExtractorError, EXTRACTOR_POLICIES
+from scheduling import TimingHistory, TIMING_HISTORY, ORDERS, DETECT_WORKERS, plan, schedule_jobs, job_from_record
 
 
 # --------------------------------------------
@@ -73,235 +25,235 @@ class File:
 # FUNCTION: MACHINE LEARNING CLASSIFIER
 def classify_using_ml(file):
     print('[*] File: {}'.format(file.file_name))
-    if file.file_type == 'image':
-        # create data frame of features from File object
-        features = pandas.DataFrame(file.features, index=[file.file_name])
-        # predict classification using svm
-        svm_prediction = img_svm_classifier.predict(features)
-        if svm_prediction == 0:
-            file.set_classification('svm', 'clean')
-        else:
-            file.set_classification('svm', 'stego')
-        # predict classification using lr
-        lr_prediction = img_lr_classifier.predict(features)
-        if lr_prediction == 0:
-            file.set_classification('lr', 'clean')
-        else:
-            file.set_classification('lr', 'stego')
-    elif file.file_type == 'video':
-        # create data frame of features from File object
-        features = pandas.DataFrame.from_dict(file.features, orient='index')
-        # predict classification using svm
-        svm_prediction = vid_svm_classifier.predict(features)
-        if 1 in svm_prediction:
-            file.set_classification('svm', 'stego')
-        else:
-            file.set_classification('svm', 'clean')
-        # predict classification using svm
-        lr_prediction = vid_lr_classifier.predict(features)
-        if 1 in lr_prediction:
-            file.set_classification('lr', 'stego')
-        else:
-            file.set_classification('lr', 'clean')
-    return file
-
-
-# FUNCTION: GET NPELO FEATURES
-def get_npelo_features(file):
-    # set up files for bash cmds
-    input_file = file.file_name
-    output_file = 'temp-features.csv'
-    extractor = 'NPELO_extractor/extractor.exe'
-    bash_cmd = 'wine {} -s -t 12 -i {} -o {}'.format(extractor, input_file, output_file)
-
-    if os.path.exists(output_file):
-        os.remove(output_file)
-    print('... Calling subprocess ')
-    video_extraction_process = subprocess.Popen([bash_cmd], stdin=subprocess.PIPE, stdout=subprocess.PIPE, shell=True)
-    output, error = video_extraction_process.communicate()
-    decoded_output = output.decode('utf-8')
-
-    print('... Handling frames')
-    # get number of frames decoded & number of expected csv lines
-    frames = 0
-    for line in decoded_output.splitlines():
-        if 'frames are decoded' in line:
-            # print(line)
-            frames = int(re.search(r'\d+', line).group())
-    expected_lines = math.ceil(frames / 12)
-
-    # set up column names for pandas
-    col_names = []
-    for i in range(36):
-        col_i = 'NPELO_{}'.format(i + 1)
-        col_names.append(col_i)
-
-    # set up row names for pandas
-    row_names = {}
-    for i in range(expected_lines):
-        row_i = '{}_f{}'.format(input_file, i + 1)
-        row_names[i] = row_i
-
-    # get data from csv
-    temp_csv = pandas.read_csv(output_file, sep=' ', names=col_names, index_col=False)
-    temp_csv.rename(index=row_names, inplace=True)
-
-    print('... Handling features')
-    features_dict = {}
-    for row_name in row_names.values():
-        features_dict[row_name] = {}
-        for col_name in col_names:
-            features_dict[row_name][col_name] = temp_csv.loc[row_name, col_name]
-
-    # remove temp-features.csv
-    if os.path.exists(output_file):
-        os.remove(output_file)
-
-    # add features to file object
-    file.features.update(features_dict)
-
+    classify_files([file], classifiers)
     return file
 
 
-# FUNCTION: GET FARID FEATURES (36 PER COLOUR CHANNEL)
-def get_farid_features(file):
-
-    # create subprocess to handle features - pysteg is a python 2 package/collection and so needs to be run in p2
-    p2_process = subprocess.Popen(['./p2-img-feature-extraction.py', 'farid', file.file_name], stdout=subprocess.PIPE)
-    stdout, _ = p2_process.communicate()
-
-    # the first 254 chars of the output are not needed
-    decoded_stdout = stdout[254:].decode('utf-8')
-
-    # split output into strings per channel
-    segmented = decoded_stdout.split('\n')
-
-    # json.loads converts string representation of list into actual list object
-    farid_r = json.loads(segmented[0])
-    farid_g = json.loads(segmented[1])
-    farid_b = json.loads(segmented[2])
+# FUNCTION: GET CLASSIFICATIONS AS A DATA FRAME, IN INPUT ORDER WHEN POSITIONS ARE GIVEN -> (data frame, column names)
+def classifications_dataframe(file_list, errors=None, positions=None):
+    classifications = {}
+    for file in file_list:
+        classifications[file.file_name] = dict(file.classification)
 
-    # start dict
-    farid_dict = {}
+    # save classifications to file
+    cols = ['File name', 'SVM Classification', 'LR Classification']
+    if any(file.sample is not None for file in file_list):
+        cols = cols + ['GOPs Examined', 'Miss Probability']
+        for file in file_list:
+            if file.sample is None or file.sample.escalated:
+                classifications[file.file_name]['segments'] = 'all' if file.file_type == 'video' else ''
+                classifications[file.file_name]['miss'] = 0.0 if file.file_type == 'video' else ''
+            else:
+                classifications[file.file_name]['segments'] = '{} of ~{}'.format(file.sample.segments,
+                                                                                file.sample.total_segments)
+                classifications[file.file_name]['miss'] = round(file.sample.miss_probability, 4)
+    # files that could not be analysed are kept, so sharded results still account for every file
+    for file_name in sorted(errors or {}):
+        classifications[file_name] = {'svm': 'error', 'lr': 'error'}
+        if len(cols) > 3:
+            classifications[file_name].update(segments='', miss='')
+    if not classifications:
+        return pandas.DataFrame(columns=cols), cols
+    if positions is not None:
+        # files finish in schedule order, so put them (& any failures) back where they were in the input
+        classifications = {file_name: classifications[file_name]
+                           for file_name in sorted(classifications, key=lambda file_name: positions[file_name])}
+    classifications_df = pandas.DataFrame.from_dict(classifications, orient='index')
+    classifications_df = classifications_df.reset_index()
+    classifications_df.index += 1
+    classifications_df.columns = cols
+    return classifications_df, cols
 
-    # populate dict
-    counter = 1
-    for feature_value in farid_r:
-        feature_name = 'farid_r_{}'.format(counter)
-        farid_dict[feature_name] = feature_value
-        counter = counter + 1
-    counter = 1
-    for feature_value in farid_g:
-        feature_name = 'farid_g_{}'.format(counter)
-        farid_dict[feature_name] = feature_value
-        counter = counter + 1
-    counter = 1
-    for feature_value in farid_b:
-        feature_name = 'farid_b_{}'.format(counter)
-        farid_dict[feature_name] = feature_value
-        counter = counter + 1
 
-    # add dict to file object
-    file.features.update(farid_dict)
+# FUNCTION: SAVE & OUTPUT CLASSIFICATIONS
+def save_classifications(file_list, errors=None, positions=None):
+    classifications_df, cols = classifications_dataframe(file_list, errors, positions)
+    classifications_df.to_csv(output_file)
 
-    return file
+    # output table to stdout
+    print('\n=== Classifications ===\n')
+    print(tabulate(classifications_df, headers=cols, tablefmt='psql'))
+    print('\nClassification information also saved to {}\n'.format(output_file))
 
 
 # FUNCTION: PERFORM STEGANALYSIS
-def perform_steganalysis(file_list):
+def perform_steganalysis(file_list, sample_config=None, policies=None, positions=None):
     print('\n=== Performing steganalysis ===\n')
+    policies = policies or EXTRACTOR_POLICIES
 
-    # get features for each file
+    # get features for each file - a file that times out, crashes or cannot be parsed is reported, not fatal
     print('Extracting features (this may take a while) ... ')
+    errors = {}
     file_number = 1
     for file in file_list:
         print('[*] File {} of {}: {} ({})'.format(file_number, len(file_list), file.file_name, file.file_type))
-        if file.file_type == 'image':
-            file = get_farid_features(file)
-        elif file.file_type == 'video':
-            file = get_npelo_features(file)
+        try:
+            if file.file_type == 'image':
+                file = get_farid_features(file, policies['farid'])
+            elif file.file_type == 'video':
+                file = get_npelo_features(file, sample_config, policies['npelo'])
+        except ExtractorError as error:
+            print('[!] Failed: {} ({})'.format(file.file_name, error))
+            errors[file.file_name] = str(error)
         file_number = file_number + 1
-    print('Feature extraction complete!\n')
+    file_list = [file for file in file_list if file.file_name not in errors]
+    print('Feature extraction complete! ({} failed)\n'.format(len(errors)))
 
     # classify each file
     print('Classifying files ...')
     for file in file_list:
         file = classify_using_ml(file)
-    classifications = {}
-    for file in file_list:
-        classifications[file.file_name] = file.classification
+        # scan all of a sampled video if the sample looks suspicious
+        if needs_escalation(file, sample_config):
+            print('[*] Suspicious sample, scanning all of: {}'.format(file.file_name))
+            sample = file.sample
+            try:
+                file = classify_using_ml(get_npelo_features(file, policy=policies['npelo']))
+                sample.escalated = True
+            except ExtractorError as error:
+                # keep the sample's classification, as the full scan could not add to it
+                print('[!] Full scan failed: {} ({})'.format(file.file_name, error))
+            file.sample = sample
     print('Classifications complete!')
 
-    # save classifications to file
-    cols = ['File name', 'SVM Classification', 'LR Classification']
-    classifications_df = pandas.DataFrame.from_dict(classifications, orient='index')
-    classifications_df = classifications_df.reset_index()
-    classifications_df.index += 1
-    classifications_df.columns = cols
-    classifications_df.to_csv(output_file)
-
-    # output table to stdout
-    print('\n=== Classifications ===\n')
-    print(tabulate(classifications_df, headers=cols, tablefmt='psql'))
-    print('\nClassification information also saved to {}\n'.format(output_file))
-
-
-# FUCNTION: GET FILE TYPE OF INPUT FILE
-def get_file_type(file_name):
-    with open(file_name, 'rb') as file:
-        file_info = fleep.get(file.read(128))
-    if file_info.type_matches('raster-image') or file_info .type_matches('raw-image'):
-        file_type = 'image'
-        file_extension = file_info.extension[0]
-    elif file_info.type_matches('video'):
-        file_type = 'video'
-        file_extension = file_info.extension[0]
+    save_classifications(file_list, errors, positions)
+    return file_list
+
+
+# FUNCTION: PERFORM STEGANALYSIS WITH OVERLAPPING STAGES
+def perform_pipelined_steganalysis(jobs, limits, sample_config=None, policies=None, positions=None):
+    print('\n=== Performing steganalysis (pipelined) ===\n')
+    print('[*] Up to {} Farid & {} NPELO extractors at once'.format(limits.farid, limits.npelo))
+    file_list, errors = run_pipeline(jobs, classifiers, limits, sample_config, policies)
+    print('[*] {} input files\n[*] {} images/videos classified\n[*] {} failed'.format(len(jobs), len(file_list),
+                                                                                     len(errors)))
+    save_classifications(file_list, errors, positions)
+    return file_list
+
+
+# FUNCTION: PRINT ESTIMATED COSTS & PROJECTED TIME WITHOUT ANALYSING ANYTHING
+def dry_run(schedule, limits):
+    rows = [[job.file_name, job.file_type, job.describe_units(), round(job.estimate, 1)] for job in schedule.jobs]
+    cols = ['File name', 'Type', 'Work', 'Estimated Seconds']
+    print('\n=== Planned order ===\n')
+    print(tabulate(rows, headers=cols, tablefmt='psql', showindex=range(1, len(rows) + 1)))
+    skipped = len([job for job in schedule.jobs if job.kind is None])
+    print('\n[*] {} files to analyse, {} not found or not an image/video'.format(len(rows) - skipped, skipped))
+    print('[*] Estimated extractor time: {:.0f}s'.format(schedule.total_estimate()))
+    if limits is None:
+        print('[*] Projected total time (serial): {:.0f}s'.format(schedule.makespan()))
     else:
-        h264_flag = 'H.264'
-        magic_info = magic.from_file(file_name)
-        if h264_flag in magic_info:
-            file_type = 'video'
-            file_extension = 'h264'
-        else:
-            file_type = 'other'
-            file_extension = pathlib.Path(file_name).suffix  # get file extension from pathlib instead
-    return file_type, file_extension
-
-
-# FUNCTION: FIND INPUT FILE IN FILESYSTEM
-def find_file(file_name):
-    if os.path.isfile(file_name):
-        return True
+        print('[*] Projected total time with {} Farid & {} NPELO extractors: {:.0f}s (input order: {:.0f}s)'.format(
+            limits.farid, limits.npelo, schedule.makespan(limits), schedule.makespan(limits, schedule.input_order())))
+
+
+# FUNCTION: WORKER - PULL BATCHES FROM A SPOOL UNTIL IT IS FINISHED
+def run_worker(spool, classifiers, limits, sample_config, poll_interval, policies=None, history=None,
+               order='longest'):
+    this_worker = worker_id()
+    print('\n === RUNNING WORKER {} ===\n'.format(this_worker))
+    # workers always pipeline - serial just means one of each stage at a time
+    limits = limits or PipelineLimits(detect=1, farid=1, npelo=1, batch_size=1)
+    history = history or TimingHistory(None)
+    while not spool.is_ready():
+        time.sleep(poll_interval)
+    while True:
+        lease = spool.lease(this_worker)
+        if lease is None:
+            if spool.is_finished():
+                break
+            # others hold the remaining batches - wait in case a lease expires
+            time.sleep(poll_interval)
+            continue
+        print('[*] Leased {} ({} files)'.format(lease.batch, len(lease.file_names)))
+        # files were detected when the spool was created, so are only re-estimated & ordered here
+        schedule = schedule_jobs([job_from_record(record) for record in lease.records], history, sample_config, order)
+        file_list, errors = run_pipeline(schedule.jobs, classifiers, limits, sample_config, policies)
+        # back in input order, failed files included, so the merged results follow the input
+        classifications_df, _ = classifications_dataframe(file_list, errors, schedule.positions())
+        spool.complete(lease, classifications_df, this_worker)
+        schedule.record(file_list)
+        history.save()
+        print('[*] Completed {}'.format(lease.batch))
+    print('[*] Spool finished, worker exiting')
+
+
+# FUNCTION: START A LOCAL WORKER PROCESS
+def start_local_worker(spool_dir, worker_args):
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker', spool_dir] + worker_args)
+
+
+# FUNCTION: COORDINATOR - SHARD INPUT, RE-ISSUE EXPIRED LEASES & MERGE RESULTS
+def run_coordinator(spool, output_file, filenames, batch_files, local_workers, start_worker, poll_interval, history,
+                    sample_config=None, order='longest', detect_workers=DETECT_WORKERS):
+    print('\n === RUNNING COORDINATOR ===\n')
+    if spool.is_ready():
+        print('[*] Resuming spool {} ({} of {} batches done)'.format(spool.spool_dir, spool.done_batches(),
+                                                                    spool.total_batches()))
     else:
-        return False
+        # costed batches, so long files are leased first & none sits behind a full batch of others
+        schedule = plan(filenames, history, sample_config, order, detect_workers)
+        batches = spool.create(schedule.batches(batch_files))
+        print('[*] {} input files sharded into {} batches in {} (~{:.0f}s of extractor time)'.format(
+            len(filenames), batches, spool.spool_dir, schedule.total_estimate()))
+
+    workers = [start_worker() for _ in range(local_workers)]
+    try:
+        while not spool.is_finished():
+            for batch in spool.reclaim_expired():
+                print('[!] Lease on {} expired, re-issuing'.format(batch))
+            # replace local workers that died, their batches come back once the lease expires
+            for i, worker in enumerate(workers):
+                if worker.poll() is not None and worker.returncode != 0:
+                    print('[!] Local worker exited with {}, restarting'.format(worker.returncode))
+                    workers[i] = start_worker()
+            time.sleep(poll_interval)
+    finally:
+        for worker in workers:
+            worker.wait()
+
+    classifications_df = spool.merge(output_file)
+    print('\n[*] {} files classified across {} batches'.format(len(classifications_df), spool.total_batches()))
+    print('\nClassification information saved to {}\n'.format(output_file))
 
 
 # FUNCTION: RUN FUNCTION FOR MAIN
-def run(filenames):
+def run(filenames, limits=None, sample_config=None, policies=None, history=None, order='longest'):
     print('\n === RUNNING PROGRAM ===\n')
 
-    # start file list & counters
-    input_file_list = []
-    input_file_count = 0
-    valid_file_count = 0
-
-    # fill file list
-    for file_name in filenames:
-        input_file_count = input_file_count + 1
-        if find_file(file_name):  # try to find file, if file can be found:
-            new_file = File(file_name)  # create File object
-            file_type, file_extension = get_file_type(file_name)  # get file type and file extension
-            if file_type != 'other':
+    # estimate each file's cost & order the work (longest first by default)
+    history = history or TimingHistory(None)
+    detect_workers = DETECT_WORKERS if limits is None else limits.detect
+    schedule = plan(filenames, history, sample_config, order, workers=detect_workers)
+    print('[*] Estimated extractor time: {:.0f}s, order: {}'.format(schedule.total_estimate(), order))
+
+    # type detection, extraction & classification overlap in the pipeline
+    if limits is not None:
+        file_list = perform_pipelined_steganalysis(schedule.jobs, limits, sample_config, policies,
+                                                   schedule.positions())
+    else:
+        # start file list & counters
+        input_file_list = []
+        input_file_count = 0
+        valid_file_count = 0
+
+        # fill file list - files were found & typed while planning
+        for job in schedule.jobs:
+            input_file_count = input_file_count + 1
+            if job.file_type != 'other':
                 valid_file_count = valid_file_count + 1
-                file_size = os.path.getsize(file_name)  # get file size
-                new_file.update_file(file_type, file_extension, file_size)  # update new_file with new info
-                input_file_list.append(new_file)  # add file object to file list
+                input_file_list.append(job.to_file())  # add file object to file list
 
-    # output (for testing)
-    print('[*] {} input files\n[*] {} valid images/videos in input files'.format(input_file_count, valid_file_count))
+        # output (for testing)
+        print('[*] {} input files\n[*] {} valid images/videos in input files'.format(input_file_count,
+                                                                                   valid_file_count))
 
-    # perform actual steganalysis
-    perform_steganalysis(input_file_list)
+        # perform actual steganalysis
+        file_list = perform_steganalysis(input_file_list, sample_config, policies, schedule.positions())
+
+    # refine future estimates with how long this run took
+    schedule.record(file_list)
+    history.save()
 
 
 # MAIN FUNCTION: GLOBAL CODE
@@ -312,33 +264,82 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='A program to detect image or video steganography')
     parser.add_argument('-f', '--filenames', action="store", nargs='+', help='Name(s) of file(s) to analyse')
     parser.add_argument('-t', '--text-file', action='store', help='Get filenames from a list in a .txt file')
+    parser.add_argument('--serial', action='store_true', help='Handle one file at a time instead of pipelining')
+    parser.add_argument('--detect-workers', action='store', type=int, default=8,
+                        help='Concurrent file type detections while planning (default: 8)')
+    parser.add_argument('--farid-workers', action='store', type=int, default=8,
+                        help='Concurrent Farid (image) extractors (default: 8)')
+    parser.add_argument('--npelo-workers', action='store', type=int, default=2,
+                        help='Concurrent Wine NPELO (video) extractors (default: 2)')
+    parser.add_argument('--batch-size', action='store', type=int, default=32,
+                        help='Most files classified in one batch (default: 32)')
+    parser.add_argument('--video-sample', action='store', type=float,
+                        help='Only analyse some GOP segments of raw H.264 videos: a fraction (< 1) or count (>= 1)')
+    parser.add_argument('--video-sample-mode', action='store', choices=['even', 'random'], default='even',
+                        help='Pick sampled segments evenly spaced or at random (default: even)')
+    parser.add_argument('--video-sample-seed', action='store', type=int, help='Seed for random segment picks')
+    parser.add_argument('--video-sample-escalate', action='store_true',
+                        help='Scan the whole video if its sample is classified as stego')
+    parser.add_argument('--timeout-scale', action='store', type=float, default=1.0,
+                        help='Multiply every extractor deadline, e.g. 2 on a slow machine (default: 1)')
+    parser.add_argument('--retries', action='store', type=int, default=1,
+                        help='Retries for an extractor that times out or crashes (default: 1)')
+    parser.add_argument('--farid-memory', action='store', type=int,
+                        help='Memory limit per Farid extractor in MB, 0 for none (default: 2048)')
+    parser.add_argument('--npelo-memory', action='store', type=int,
+                        help='Memory limit per NPELO extractor in MB, 0 for none (default: 4096)')
+    parser.add_argument('--farid-max-timeout', action='store', type=float,
+                        help='Most seconds per Farid run, whatever the image size, 0 for none (default: 600)')
+    parser.add_argument('--npelo-max-timeout', action='store', type=float,
+                        help='Most seconds per NPELO run, whatever the video length (default: none)')
+    parser.add_argument('--order', action='store', choices=ORDERS, default='longest',
+                        help='Analyse the longest files first (shortest finish time), the shortest first (quick '
+                             'feedback) or in input order (default: longest)')
+    parser.add_argument('--timing-history', action='store', default=TIMING_HISTORY,
+                        help='File of past extractor timings used to estimate costs (default: {})'.format(
+                            TIMING_HISTORY))
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only print the planned order & projected total time')
+    parser.add_argument('--coordinator', action='store', metavar='SPOOL_DIR',
+                        help='Shard the input into a spool directory for workers & merge their results')
+    parser.add_argument('--worker', action='store', metavar='SPOOL_DIR', help='Analyse batches from a spool directory')
+    parser.add_argument('--batch-files', action='store', type=int, default=500,
+                        help='Files per spool batch (default: 500)')
+    parser.add_argument('--local-workers', action='store', type=int, default=0,
+                        help='Worker processes for the coordinator to start on this host (default: 0)')
+    parser.add_argument('--worker-start', action='store', choices=['fork', 'spawn'],
+                        default='fork' if can_fork() else 'spawn',
+                        help='Fork local workers from the coordinator, sharing its loaded classifiers, or spawn '
+                             'fresh processes that each load their own (default: fork where available)')
+    parser.add_argument('--lease-timeout', action='store', type=float, default=600,
+                        help='Seconds before a silent worker\'s batch is re-issued (default: 600)')
+    parser.add_argument('--poll-interval', action='store', type=float, default=2,
+                        help='Seconds between spool checks (default: 2)')
     args = parser.parse_args()
 
-    # check for classifiers
-    img_svm_joblib = 'img-svm.joblib'
-    vid_svm_joblib = 'vid-svm.joblib'
-    img_lr_joblib = 'img-lr.joblib'
-    vid_lr_joblib = 'vid-lr.joblib'
-    if not (find_file(img_svm_joblib) and find_file(vid_svm_joblib)
-            and find_file(img_lr_joblib) and find_file(vid_lr_joblib)):
-        print('Classifiers not found!')
-        sys.exit(1)
+    # set up output file
+    output_file = 'classifications.csv'
 
-    # load in classifiers
-    img_svm_classifier = joblib.load(img_svm_joblib)
-    vid_svm_classifier = joblib.load(vid_svm_joblib)
-    img_lr_classifier = joblib.load(img_lr_joblib)
-    vid_lr_classifier = joblib.load(vid_lr_joblib)
-    print('[*] Classifiers successfully loaded')
+    # the coordinator never classifies, but loads the classifiers once for the local workers it forks
+    classifiers = None
+    fork_workers = bool(args.coordinator and args.local_workers > 0 and args.worker_start == 'fork')
+    if (not args.coordinator or fork_workers) and not args.dry_run:
+        # check for classifiers
+        if not classifiers_found():
+            print('Classifiers not found!')
+            sys.exit(1)
+
+        # load in classifiers
+        classifiers = load_classifiers()
+        print('[*] Classifiers successfully loaded')
 
     # set up file array
     input_files = []
 
-    # set up output file
-    output_file = 'classifications.csv'
-
     # handle arguments
-    if args.filenames:
+    if args.worker:
+        pass
+    elif args.filenames:
         input_files = args.filenames
     elif args.text_file:
         if os.path.isfile(args.text_file):
@@ -349,5 +350,72 @@ if __name__ == '__main__':
         parser.print_help(sys.stderr)
         sys.exit(1)
 
+    # set up pipeline limits
+    limits = None
+    if not args.serial:
+        limits = PipelineLimits(detect=args.detect_workers, farid=args.farid_workers, npelo=args.npelo_workers,
+                                batch_size=args.batch_size)
+
+    # set up video sampling
+    sample_config = None
+    if args.video_sample is not None:
+        if args.video_sample <= 0:
+            print('--video-sample must be above 0')
+            sys.exit(1)
+        sample_config = SampleConfig(args.video_sample, mode=args.video_sample_mode, seed=args.video_sample_seed,
+                                     escalate=args.video_sample_escalate)
+
+    # set up extractor deadlines, resource limits & retries
+    if args.timeout_scale <= 0 or args.retries < 0:
+        print('--timeout-scale must be above 0 & --retries at least 0')
+        sys.exit(1)
+    policies = {'farid': EXTRACTOR_POLICIES['farid'].adjusted(args.timeout_scale, args.retries, args.farid_memory,
+                                                              args.farid_max_timeout),
+                'npelo': EXTRACTOR_POLICIES['npelo'].adjusted(args.timeout_scale, args.retries, args.npelo_memory,
+                                                              args.npelo_max_timeout)}
+
+    # set up cost estimates
+    history = TimingHistory(args.timing_history)
+
     # run main program
-    run(input_files)
+    if args.dry_run:
+        dry_run(plan(input_files, history, sample_config, args.order, args.detect_workers), limits)
+    elif args.worker:
+        run_worker(Spool(args.worker, args.lease_timeout), classifiers, limits, sample_config, args.poll_interval,
+                   policies, history, args.order)
+    elif args.coordinator:
+        # pass this run's analysis options on to local workers
+        worker_args = ['--detect-workers', str(args.detect_workers), '--farid-workers', str(args.farid_workers),
+                       '--npelo-workers', str(args.npelo_workers), '--batch-size', str(args.batch_size),
+                       '--lease-timeout', str(args.lease_timeout), '--poll-interval', str(args.poll_interval),
+                       '--timeout-scale', str(args.timeout_scale), '--retries', str(args.retries),
+                       '--order', args.order, '--timing-history', args.timing_history]
+        if args.farid_memory is not None:
+            worker_args += ['--farid-memory', str(args.farid_memory)]
+        if args.npelo_memory is not None:
+            worker_args += ['--npelo-memory', str(args.npelo_memory)]
+        if args.farid_max_timeout is not None:
+            worker_args += ['--farid-max-timeout', str(args.farid_max_timeout)]
+        if args.npelo_max_timeout is not None:
+            worker_args += ['--npelo-max-timeout', str(args.npelo_max_timeout)]
+        if args.serial:
+            worker_args.append('--serial')
+        if sample_config is not None:
+            worker_args += ['--video-sample', str(args.video_sample), '--video-sample-mode', args.video_sample_mode]
+            if args.video_sample_seed is not None:
+                worker_args += ['--video-sample-seed', str(args.video_sample_seed)]
+            if args.video_sample_escalate:
+                worker_args.append('--video-sample-escalate')
+
+        # forked workers get this run's options (& classifiers) directly, spawned ones on the command line
+        def start_worker():
+            if fork_workers:
+                return ForkedWorker(run_worker, Spool(args.coordinator, args.lease_timeout), classifiers, limits,
+                                    sample_config, args.poll_interval, policies, history, args.order)
+            return start_local_worker(args.coordinator, worker_args)
+
+        run_coordinator(Spool(args.coordinator, args.lease_timeout), output_file, input_files, args.batch_files,
+                        args.local_workers, start_worker, args.poll_interval, history, sample_config, args.order,
+                        args.detect_workers)
+    else:
+        run(input_files, limits, sample_config, policies, history, args.order)
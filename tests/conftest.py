@@ -0,0 +1,19 @@
+import importlib.util
+import os
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# FUNCTION: IMPORT ONE OF THE HYPHENATED SCRIPTS AS A MODULE
+def load_script(file_name):
+    module_name = os.path.splitext(file_name)[0].replace('-', '_')
+    if module_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, file_name))
+        module = importlib.util.module_from_spec(spec)
+        # registered before running, so process pools can find its functions by name
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[module_name]
@@ -0,0 +1,167 @@
+import argparse
+import csv
+import json
+import os
+import threading
+import http.server
+import functools
+import pytest
+from conftest import load_script
+
+
+builder = load_script('build-training-set.py')
+
+JPEG = b'\xff\xd8\xff\xe0' + bytes(range(256)) * 8 + b'\xff\xd9'
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+# FIXTURE: A LOCAL HTTP SERVER WITH SOME JPEGS, A NON-JPEG & A MISSING FILE -> (url list path, urls)
+@pytest.fixture
+def image_server(tmp_path):
+    site = tmp_path / 'site'
+    site.mkdir()
+    urls = []
+    handler = functools.partial(QuietHandler, directory=str(site))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    base = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    for i in range(8):
+        (site / 'image{}.jpg'.format(i)).write_bytes(JPEG + bytes([i]))
+        urls.append(base + 'image{}.jpg'.format(i))
+    (site / 'page.jpg').write_bytes(b'<html>not an image</html>')
+    urls += [base + 'page.jpg', base + 'missing.jpg']
+    url_list = tmp_path / 'urls.txt'
+    url_list.write_text(''.join('{} {}\n'.format(i, url) for i, url in enumerate(urls)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield str(url_list), urls
+    server.shutdown()
+    server.server_close()
+
+
+def make_args(tmp_path, url_list, **overrides):
+    args = argparse.Namespace(url_list=url_list, output_dir=str(tmp_path / 'data'), secrets_dir=str(tmp_path / 'secrets'),
+                              count=5, download_workers=4, embed_workers=2, embedder='append', seed=1,
+                              skip_embed=False)
+    for key, value in overrides.items():
+        setattr(args, key, value)
+    return args
+
+
+def read_manifest(args):
+    with open(os.path.join(args.output_dir, builder.MANIFEST_NAME)) as manifest_file:
+        return [json.loads(line) for line in manifest_file]
+
+
+def read_pwd_info(args):
+    with open(os.path.join(args.secrets_dir, 'pwd-info.csv'), newline='') as csv_file:
+        return list(csv.reader(csv_file, delimiter='\t'))[1:]
+
+
+def test_downloads_validate_and_embed(tmp_path, image_server):
+    url_list, urls = image_server
+    args = make_args(tmp_path, url_list)
+    builder.run(args)
+
+    records = read_manifest(args)
+    downloads = {(record['group'], record['url']): record for record in records if record['stage'] == 'download'}
+    assert len(downloads) == 10
+    for (group, url), record in downloads.items():
+        if url.endswith('missing.jpg'):
+            assert record['status'] == 'failed'
+        elif url.endswith('page.jpg'):
+            assert record['status'] == 'rejected'
+        else:
+            assert record['status'] == 'ok'
+            assert os.path.isfile(os.path.join(args.output_dir, group, record['file']))
+
+    # every stego image carries a payload & is listed once in pwd-info.csv
+    embedded = [record for record in records if record['stage'] == 'embed']
+    stego_files = sorted(os.listdir(os.path.join(args.output_dir, 'stego')))
+    assert sorted(record['file'] for record in embedded) == stego_files
+    for record in embedded:
+        with open(os.path.join(args.output_dir, 'stego', record['file']), 'rb') as stego:
+            data = stego.read()
+        assert data.startswith(JPEG) and data.endswith(open(record['secret'], 'rb').read())
+    rows = read_pwd_info(args)
+    assert sorted(os.path.basename(row[0]) for row in rows) == stego_files
+    assert not [name for name in stego_files if name.endswith('.part')]
+
+
+def test_resume_does_not_repeat_work(tmp_path, image_server):
+    url_list, _ = image_server
+    args = make_args(tmp_path, url_list)
+    builder.run(args)
+    stego_dir = os.path.join(args.output_dir, 'stego')
+    before = {name: open(os.path.join(stego_dir, name), 'rb').read() for name in os.listdir(stego_dir)}
+    first_run = read_manifest(args)
+
+    builder.run(args)
+    after = {name: open(os.path.join(stego_dir, name), 'rb').read() for name in os.listdir(stego_dir)}
+    assert after == before  # no second payload
+    # only failed downloads are tried again
+    retried = read_manifest(args)[len(first_run):]
+    assert sorted(record['url'] for record in retried) == \
+        sorted(record['url'] for record in first_run if record['status'] == 'failed')
+
+
+def test_interrupted_embed_is_finished_on_resume(tmp_path, image_server):
+    url_list, _ = image_server
+    args = make_args(tmp_path, url_list, skip_embed=True)
+    builder.run(args)
+    stego_dir = os.path.join(args.output_dir, 'stego')
+    name = sorted(os.listdir(stego_dir))[0]
+    file_path = os.path.join(stego_dir, name)
+    clean = open(file_path, 'rb').read()
+
+    # as if interrupted after the embed was recorded, but before the copy replaced the original
+    manifest = builder.Manifest(os.path.join(args.output_dir, builder.MANIFEST_NAME))
+    url = [record['url'] for record in read_manifest(args) if record['group'] == 'stego' and record.get('file') == name
+           and record['status'] == 'ok'][0]
+    secret = tmp_path / 'secret.txt'
+    secret.write_text('payload\n')
+    builder.embed_copy(builder.append_embed, file_path, str(secret), 'password')
+    manifest.add({'stage': 'embed', 'group': 'stego', 'url': url, 'file': name, 'status': 'ok',
+                  'secret': str(secret), 'password': 'password'})
+    manifest.close()
+    assert open(file_path, 'rb').read() == clean
+
+    builder.run(make_args(tmp_path, url_list))
+    assert open(file_path, 'rb').read() == clean + b'password\npayload\n'
+    assert not os.path.exists(file_path + builder.EMBED_SUFFIX)
+    assert [str(secret), 'password'] in [row[1:] for row in read_pwd_info(args) if row[0] == file_path]
+
+
+# FUNCTION: EMBEDDER THAT BREAKS RATHER THAN REJECTING THE IMAGE (AS STEGHIDE WOULD IF IT VANISHED MID-RUN)
+def broken_embed(cover_file, secret_file, password):
+    raise OSError('embedder not runnable')
+
+
+def test_embedder_error_keeps_the_image_for_resume(tmp_path, image_server, monkeypatch):
+    url_list, _ = image_server
+    args = make_args(tmp_path, url_list)
+    monkeypatch.setitem(builder.EMBEDDERS, 'append', broken_embed)
+    builder.run(args)
+    stego_dir = os.path.join(args.output_dir, 'stego')
+    stego_files = sorted(os.listdir(stego_dir))
+    embeds = [record for record in read_manifest(args) if record['stage'] == 'embed']
+    assert stego_files and sorted(record['file'] for record in embeds) == stego_files
+    assert {record['status'] for record in embeds} == {'failed'} and read_pwd_info(args) == []
+
+    # retried once the embedder works
+    monkeypatch.undo()
+    builder.run(args)
+    assert sorted(os.listdir(stego_dir)) == stego_files
+    assert sorted(os.path.basename(row[0]) for row in read_pwd_info(args)) == stego_files
+
+
+def test_missing_steghide_fails_before_downloading(tmp_path, image_server, monkeypatch):
+    url_list, _ = image_server
+    args = make_args(tmp_path, url_list, embedder='steghide')
+    monkeypatch.setattr(builder.shutil, 'which', lambda name: None)
+    with pytest.raises(ValueError, match='steghide not found'):
+        builder.run(args)
+    assert not os.path.exists(args.output_dir)
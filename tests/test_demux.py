@@ -0,0 +1,217 @@
+import os
+import struct
+import pytest
+from demux import PipeStream, iter_annexb, container_format, ANNEXB_START_CODE
+
+
+SPS = b'\x67\x42\x00\x1e\xab'
+PPS = b'\x68\xce\x38\x80'
+PARAMETER_SETS = ANNEXB_START_CODE + SPS + ANNEXB_START_CODE + PPS
+
+# samples of NAL units: an IDR frame, two P frames, another IDR (with SEI) & a P frame
+SAMPLES = [
+    [b'\x65' + bytes(range(40))],
+    [b'\x41\x9a' + b'\x11' * 9],
+    [b'\x41\x9b' + b'\x22' * 300],
+    [b'\x06\x05\x01\x80', b'\x65\x88' + b'\x33' * 17],
+    [b'\x41\x9c'],
+]
+SYNC_SAMPLES = (0, 3)
+
+
+# --------------------------------------------
+
+# CONTAINER BUILDERS
+
+# --------------------------------------------
+
+
+def avcc_record(length_size=4):
+    return (bytes([1, 0x42, 0x00, 0x1e, 0xfc | (length_size - 1), 0xe1]) + struct.pack('>H', len(SPS)) + SPS +
+            b'\x01' + struct.pack('>H', len(PPS)) + PPS)
+
+
+def length_prefixed(nal_units, length_size=4):
+    return b''.join(len(nal_unit).to_bytes(length_size, 'big') + nal_unit for nal_unit in nal_units)
+
+
+def expected_annexb(sync_samples=SYNC_SAMPLES, sample_count=len(SAMPLES)):
+    stream = b''
+    for number, nal_units in enumerate(SAMPLES[:sample_count]):
+        if number == 0 or number in sync_samples:
+            stream = stream + PARAMETER_SETS
+        stream = stream + b''.join(ANNEXB_START_CODE + nal_unit for nal_unit in nal_units)
+    return stream
+
+
+def box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type, payload):
+    return box(box_type, b'\x00\x00\x00\x00' + payload)
+
+
+def make_mp4(length_size=4, chunk_sizes=(2, 3), sync=True, offsets_box=b'stco', fragmented=False):
+    samples = [] if fragmented else [length_prefixed(nal_units, length_size) for nal_units in SAMPLES]
+    avc1 = box(b'avc1', bytes(78) + box(b'avcC', avcc_record(length_size)))
+    ftyp = box(b'ftyp', b'isom\x00\x00\x02\x00isomavc1')
+
+    def moov(chunk_offsets):
+        stsd = full_box(b'stsd', struct.pack('>I', 1) + avc1)
+        stsz = full_box(b'stsz', struct.pack('>II', 0, len(samples)) + b''.join(struct.pack('>I', len(sample))
+                                                                                for sample in samples))
+        # first run: chunk 1 has chunk_sizes[0] samples, from chunk 2 on chunk_sizes[1]
+        stsc = full_box(b'stsc', struct.pack('>IIIIIII', 2, 1, chunk_sizes[0], 1, 2, chunk_sizes[1], 1)
+                        if samples else struct.pack('>I', 0))
+        offset_format = 'I' if offsets_box == b'stco' else 'Q'
+        stco = full_box(offsets_box, struct.pack('>I', len(chunk_offsets)) +
+                        b''.join(struct.pack('>' + offset_format, offset) for offset in chunk_offsets))
+        tables = stsd + stsz + stsc + stco
+        if sync:
+            tables = tables + full_box(b'stss', struct.pack('>I', len(SYNC_SAMPLES)) +
+                                       b''.join(struct.pack('>I', number + 1) for number in SYNC_SAMPLES))
+        hdlr = full_box(b'hdlr', b'\x00' * 4 + b'vide' + b'\x00' * 12 + b'video\x00')
+        trak = box(b'trak', box(b'mdia', hdlr + box(b'minf', box(b'stbl', tables))))
+        # fragmented files keep their samples in moof boxes, announced by mvex
+        mvex = box(b'mvex', full_box(b'trex', struct.pack('>IIIII', 1, 1, 0, 0, 0))) if fragmented else b''
+        return box(b'moov', trak + mvex)
+
+    # chunk offsets depend on the moov size, which does not depend on their values
+    chunks = []
+    position = 0
+    for size in (chunk_sizes[0],) + (chunk_sizes[1],) * len(SAMPLES):
+        if position >= len(samples):
+            break
+        chunks.append(b''.join(samples[position:position + size]))
+        position = position + size
+    mdat_start = len(ftyp) + len(moov([0] * len(chunks))) + 8
+    chunk_offsets = []
+    offset = mdat_start
+    for chunk in chunks:
+        chunk_offsets.append(offset)
+        offset = offset + len(chunk)
+    data = ftyp + moov(chunk_offsets) + box(b'mdat', b''.join(chunks))
+    if fragmented:
+        data = data + box(b'moof', full_box(b'mfhd', struct.pack('>I', 1))) + box(b'mdat', b'\x00' * 16)
+    return data
+
+
+def ebml_size(size, unknown=False):
+    if unknown:
+        return b'\x01\xff\xff\xff\xff\xff\xff\xff'
+    return (size | (1 << 56)).to_bytes(8, 'big')
+
+
+def element(element_id, payload, unknown=False):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big') + ebml_size(len(payload), unknown) + payload
+
+
+def make_mkv(unknown_size=False, lacing=False, track_number=1):
+    header = element(0x1A45DFA3, element(0x4282, b'matroska'))
+    track_entry = element(0xAE, element(0xD7, bytes([track_number])) + element(0x83, b'\x01') +
+                          element(0x86, b'V_MPEG4/ISO/AVC') + element(0x63A2, avcc_record()))
+    audio_entry = element(0xAE, element(0xD7, b'\x02') + element(0x83, b'\x02') + element(0x86, b'A_AAC'))
+    tracks = element(0x1654AE6B, audio_entry + track_entry)
+    blocks = b''
+    for number, nal_units in enumerate(SAMPLES):
+        flags = (0x80 if number in SYNC_SAMPLES else 0x00) | (0x02 if lacing and number == 2 else 0x00)
+        block = bytes([0x80 | track_number]) + b'\x00\x00' + bytes([flags]) + length_prefixed(nal_units)
+        blocks = blocks + element(0xA3, block)
+        # an audio block in between, which should be skipped
+        blocks = blocks + element(0xA3, b'\x82\x00\x00\x80' + b'\xaa' * 5)
+    cluster = element(0x1F43B675, element(0xE7, b'\x00') + blocks, unknown_size)
+    return header + element(0x18538067, element(0x1549A966, element(0x2AD7B1, b'\x0f\x42\x40')) + tracks + cluster,
+                            unknown_size)
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+# --------------------------------------------
+
+# TESTS
+
+# --------------------------------------------
+
+
+@pytest.mark.parametrize('options', [{}, {'length_size': 2}, {'chunk_sizes': (1, 1)}, {'offsets_box': b'co64'}])
+def test_mp4_to_annexb(tmp_path, options):
+    path = write(tmp_path, 'clip.mp4', make_mp4(**options))
+    assert container_format(path) == 'mp4'
+    assert b''.join(iter_annexb(path)) == expected_annexb()
+
+
+def test_mp4_without_stss_treats_every_sample_as_sync(tmp_path):
+    path = write(tmp_path, 'clip.mp4', make_mp4(sync=False))
+    assert b''.join(iter_annexb(path)) == expected_annexb(sync_samples=range(len(SAMPLES)))
+
+
+def test_fragmented_mp4_is_rejected(tmp_path):
+    path = write(tmp_path, 'clip.mp4', make_mp4(fragmented=True))
+    with pytest.raises(ValueError, match='fragmented'):
+        list(iter_annexb(path))
+
+
+@pytest.mark.parametrize('unknown_size', [False, True])
+def test_mkv_to_annexb(tmp_path, unknown_size):
+    path = write(tmp_path, 'clip.mkv', make_mkv(unknown_size=unknown_size))
+    assert container_format(path) == 'mkv'
+    assert b''.join(iter_annexb(path)) == expected_annexb()
+
+
+def test_mkv_laced_block_is_rejected(tmp_path):
+    path = write(tmp_path, 'clip.mkv', make_mkv(lacing=True))
+    with pytest.raises(ValueError, match='Laced'):
+        list(iter_annexb(path))
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = write(tmp_path, 'clip.h264', expected_annexb())
+    assert container_format(path) is None
+    with pytest.raises(ValueError):
+        iter_annexb(path)
+
+
+# FUNCTION: READ A PIPE STREAM TO THE END, AS THE EXTRACTOR WOULD
+def read_pipe(stream):
+    with open(stream.path, 'rb') as pipe:
+        return pipe.read()
+
+
+def test_pipe_stream_feeds_annexb(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stream = PipeStream(write(tmp_path, 'clip.mkv', make_mkv()))
+    try:
+        assert read_pipe(stream) == expected_annexb()
+        stream.check()
+    finally:
+        stream.close()
+    assert not os.path.exists(stream.path)
+
+
+def test_pipe_stream_reports_failure_after_reader_exits(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stream = PipeStream(write(tmp_path, 'clip.mkv', make_mkv(lacing=True)))
+    try:
+        # the reader sees a clean EOF after the samples before the laced one, but check() still reports it
+        assert read_pipe(stream) == expected_annexb(sample_count=2)
+        with pytest.raises(ValueError, match='Laced'):
+            stream.check()
+    finally:
+        stream.close()
+
+
+def test_pipe_stream_never_read(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stream = PipeStream(write(tmp_path, 'clip.mkv', make_mkv()))
+    try:
+        with pytest.raises(ValueError, match='never read'):
+            stream.check()
+        assert not stream.thread.is_alive()
+    finally:
+        stream.close()
+
@@ -0,0 +1,67 @@
+import asyncio
+import time
+import pytest
+import extractor_policy
+from extractor_policy import ExtractorPolicy, ExtractorError, NPELO_POLICY, TIMEOUT, CRASH, MB, run_extractor, \
+    run_extractor_async
+
+
+READ_LIMITS = ['sh', '-c', 'grep -E "cpu time|data size" /proc/self/limits']
+
+
+def read_limits(stdout):
+    # -> { 'cpu' : soft, 'data' : soft }
+    limits = {}
+    for line in stdout.decode().splitlines():
+        limits['cpu' if 'cpu time' in line else 'data'] = int(line.split()[3])
+    return limits
+
+
+def run_async(coroutine):
+    # set up as run_pipeline does, as before Python 3.8 subprocesses need the loop to be current
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_npelo_deadline_scales_with_frames_without_cap():
+    # a three hour, 30 fps video
+    frames = 3 * 60 * 60 * 30
+    assert NPELO_POLICY.deadline(0, frames) == NPELO_POLICY.timeout + frames * NPELO_POLICY.timeout_per_frame
+    assert NPELO_POLICY.adjusted(max_timeout=3600).deadline(0, frames) == 3600
+    assert NPELO_POLICY.adjusted(2).deadline(0, frames) == 2 * NPELO_POLICY.deadline(0, frames)
+
+
+def test_adjusted_cap():
+    policy = ExtractorPolicy(timeout=10, timeout_per_mb=1, max_timeout=100)
+    assert policy.adjusted(2).max_timeout == 200
+    assert policy.adjusted(2, max_timeout=50).max_timeout == 50
+    assert policy.adjusted(max_timeout=0).max_timeout is None
+
+
+@pytest.mark.parametrize('prlimit', [extractor_policy.PRLIMIT, None])
+def test_limits_are_applied(monkeypatch, prlimit):
+    # with the prlimit command, or set on the running process without it
+    monkeypatch.setattr(extractor_policy, 'PRLIMIT', prlimit)
+    policy = ExtractorPolicy(timeout=30, timeout_per_mb=0, memory=512)
+    command = READ_LIMITS if prlimit else ['sh', '-c', 'sleep 0.2; ' + READ_LIMITS[2]]
+    assert read_limits(run_extractor(command, policy, 30)) == {'cpu': 30, 'data': 512 * MB}
+    stdout = run_async(run_extractor_async(command, policy, 45))
+    assert read_limits(stdout) == {'cpu': 45, 'data': 512 * MB}
+
+
+def test_timeout_kills_the_process_group():
+    started = time.monotonic()
+    with pytest.raises(ExtractorError) as error:
+        run_extractor(['sh', '-c', 'sleep 60 & sleep 60'], ExtractorPolicy(timeout=1, timeout_per_mb=0), 0.5)
+    assert error.value.kind == TIMEOUT and time.monotonic() - started < 5
+
+
+def test_crash():
+    with pytest.raises(ExtractorError) as error:
+        run_extractor(['sh', '-c', 'kill -ABRT $$'], ExtractorPolicy(timeout=1, timeout_per_mb=0), 5)
+    assert error.value.kind == CRASH and 'SIGABRT' in error.value.message
@@ -0,0 +1,193 @@
+import os
+import pytest
+from gop_sampling import (SampleConfig, read_ue, next_nal, is_random_access, next_segment_start, parameter_sets,
+                          estimate_frames, miss_probability, write_sampled_stream, NAL_SLICE, NAL_IDR)
+
+
+START_CODE = b'\x00\x00\x01'
+LONG_START_CODE = b'\x00\x00\x00\x01'
+SPS = LONG_START_CODE + b'\x67\x42\x00\x1e\xab'
+PPS = LONG_START_CODE + b'\x68\xce\x38\x80'
+HEADER = SPS + PPS
+AUD = LONG_START_CODE + b'\x09\xf0'
+SEI = START_CODE + b'\x06\x05\x01\x80'
+PICTURES_PER_GOP = 5
+
+
+# --------------------------------------------
+
+# STREAM BUILDERS
+
+# --------------------------------------------
+
+
+def ue_bits(value):
+    # unsigned exp-golomb code as a string of bits
+    code = bin(value + 1)[2:]
+    return '0' * (len(code) - 1) + code
+
+
+def slice_nal(nal_type, slice_type, filler, first_mb=0, length=40):
+    bits = ue_bits(first_mb) + ue_bits(slice_type)
+    bits = bits + '0' * (-len(bits) % 8)
+    header = int(bits, 2).to_bytes(len(bits) // 8, 'big')
+    # filler bytes are never 0, so never look like a start code
+    return (START_CODE + bytes([(0x60 if nal_type == NAL_IDR else 0x40) | nal_type]) + header +
+            bytes([filler]) * length)
+
+
+def gop(number, pictures=PICTURES_PER_GOP):
+    # an IDR picture (I slice) then P pictures, behind an access unit delimiter & an SEI message
+    filler = 0x10 + number % 0xe0
+    return AUD + SEI + slice_nal(NAL_IDR, 7, filler) + b''.join(slice_nal(NAL_SLICE, 5, filler)
+                                                                 for _ in range(pictures - 1))
+
+
+def make_stream(gop_count, long_gops=()):
+    # -> (stream, [each GOP]), GOPs numbered in long_gops are 30 times longer
+    gops = [gop(number, PICTURES_PER_GOP * 30 if number in long_gops else PICTURES_PER_GOP)
+            for number in range(gop_count)]
+    return HEADER + b''.join(gops), gops
+
+
+def write_stream(tmp_path, stream, name='clip.h264'):
+    path = tmp_path / name
+    path.write_bytes(stream)
+    return str(path)
+
+
+def sample(tmp_path, monkeypatch, stream, config):
+    # -> (VideoSample, sampled stream bytes) or (None, None)
+    monkeypatch.chdir(tmp_path)
+    sample_file, video_sample = write_sampled_stream(write_stream(tmp_path, stream), config)
+    if sample_file is None:
+        return None, None
+    with open(sample_file, 'rb') as sample_stream:
+        data = sample_stream.read()
+    os.remove(sample_file)
+    return video_sample, data
+
+
+def sampled_gops(data, gops):
+    # -> GOP numbers in a sampled stream, checking every segment starts with the parameter sets
+    segments = data.split(HEADER)
+    assert segments[0] == b''
+    return [gops.index(segment) for segment in segments[1:]]
+
+
+# --------------------------------------------
+
+# TESTS
+
+# --------------------------------------------
+
+
+def test_read_ue():
+    values = [0, 1, 2, 3, 7, 8, 30, 255, 1000]
+    bits = ''.join(ue_bits(value) for value in values)
+    bits = bits + '1' * (-len(bits) % 8)
+    data = int(bits, 2).to_bytes(len(bits) // 8, 'big')
+    bit = 0
+    for value in values:
+        decoded, bit = read_ue(data, bit)
+        assert decoded == value
+
+
+def test_next_nal_includes_long_start_codes():
+    stream = HEADER + START_CODE + b'\x65'
+    assert next_nal(stream, 0) == (0, 4)
+    assert next_nal(stream, 4) == (len(SPS), len(SPS) + 4)
+    assert next_nal(stream, len(HEADER) + 1) is None
+    assert next_nal(stream, len(SPS) + 4) == (len(HEADER), len(HEADER) + 3)
+
+
+@pytest.mark.parametrize('nal_type, slice_type, first_mb, expected', [
+    (NAL_IDR, 7, 0, True),     # IDR picture
+    (NAL_SLICE, 7, 0, True),   # I picture without IDR
+    (NAL_SLICE, 2, 0, True),
+    (NAL_SLICE, 5, 0, False),  # P picture
+    (NAL_SLICE, 6, 0, False),  # B picture
+    (NAL_IDR, 7, 3, False),    # a later slice of an IDR picture
+])
+def test_is_random_access(nal_type, slice_type, first_mb, expected):
+    nal = slice_nal(nal_type, slice_type, 0x55, first_mb)
+    assert is_random_access(nal, len(START_CODE), nal_type) == expected
+
+
+def test_segments_start_at_their_prefix_nal_units():
+    stream, gops = make_stream(4)
+    second = len(HEADER) + len(gops[0])
+    # the parameter sets, delimiter & SEI in front of the first IDR belong to the first segment
+    assert next_segment_start(stream, 0) == 0
+    assert next_segment_start(stream, 0, skip_first_picture=True) == second
+    # from inside a GOP's pictures, snaps forward to the next one's delimiter
+    assert next_segment_start(stream, len(HEADER) + len(AUD) + len(SEI) + 10) == second
+    assert next_segment_start(stream, len(stream) - 10) is None
+
+
+def test_parameter_sets():
+    stream, _ = make_stream(2)
+    assert parameter_sets(stream) == HEADER
+
+
+def test_estimate_frames(tmp_path):
+    stream, _ = make_stream(40)
+    path = write_stream(tmp_path, stream)
+    assert estimate_frames(path) == 40 * PICTURES_PER_GOP
+    # from a window of the file, scaled to its size
+    assert abs(estimate_frames(path, window=len(stream) // 4) - 40 * PICTURES_PER_GOP) <= PICTURES_PER_GOP
+
+
+@pytest.mark.parametrize('budget, expected', [(0.1, 4), (0.5, 19), (5, 5), (1, 1)])
+def test_even_sample_counts(tmp_path, monkeypatch, budget, expected):
+    stream, gops = make_stream(40)
+    video_sample, data = sample(tmp_path, monkeypatch, stream, SampleConfig(budget))
+    # the first segment (with the parameter sets) is measured, so 40 GOPs are first estimated as 37
+    assert len(stream) // (len(HEADER) + len(gops[0])) == 37
+    numbers = sampled_gops(data, gops)
+    assert video_sample.segments == len(numbers) == expected
+    assert numbers == sorted(set(numbers))
+    # then refined from the segments read
+    assert video_sample.total_segments == 40
+    assert video_sample.miss_probability == miss_probability(expected, 40, 0.05)
+
+
+def test_random_sample_is_seeded(tmp_path, monkeypatch):
+    stream, gops = make_stream(40)
+    config = SampleConfig(6, mode='random', seed=3)
+    first_sample, first = sample(tmp_path, monkeypatch, stream, config)
+    _, again = sample(tmp_path, monkeypatch, stream, config)
+    assert first == again
+    numbers = sampled_gops(first, gops)
+    # picks in the same GOP are only written once
+    assert 1 <= first_sample.segments == len(numbers) <= 6 and numbers == sorted(set(numbers))
+
+
+def test_picks_in_one_long_gop_are_written_once(tmp_path, monkeypatch):
+    stream, gops = make_stream(31, long_gops=(15,))
+    video_sample, data = sample(tmp_path, monkeypatch, stream, SampleConfig(10))
+    numbers = sampled_gops(data, gops)
+    # about half the evenly spaced picks land inside GOP 15, & all snap forward to GOP 16
+    assert numbers == sorted(set(numbers)) and 16 in numbers
+    assert video_sample.segments == len(numbers) < 10
+
+
+# 37 is the first estimate of the GOP count (see above), so a count of 37 or more is the whole video
+@pytest.mark.parametrize('budget', [37, 100, 0.99])
+def test_whole_video_budget_is_a_full_scan(tmp_path, monkeypatch, budget):
+    stream, _ = make_stream(40)
+    assert sample(tmp_path, monkeypatch, stream, SampleConfig(budget)) == (None, None)
+
+
+def test_stream_without_random_access_points_is_a_full_scan(tmp_path, monkeypatch):
+    stream = HEADER + b''.join(slice_nal(NAL_SLICE, 5, 0x20) for _ in range(200))
+    assert sample(tmp_path, monkeypatch, stream, SampleConfig(0.1)) == (None, None)
+
+
+def test_miss_probability():
+    assert miss_probability(0, 20, 0.05) == 1.0
+    assert miss_probability(1, 20, 0.05) == pytest.approx(19 / 20)
+    assert miss_probability(2, 20, 0.1) == pytest.approx(18 / 20 * 17 / 19)
+    # too many segments sampled to miss every affected one
+    assert miss_probability(19, 20, 0.1) == 0.0
+    assert miss_probability(4, 1000, 0.05) > miss_probability(40, 1000, 0.05)
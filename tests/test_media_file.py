@@ -0,0 +1,41 @@
+import numpy
+import pandas
+from media_file import File, FARID_SCHEMA, NPELO_SCHEMA, features_dataframe
+
+
+def make_file(file_name, file_type, schema, rows, seed):
+    file = File(file_name)
+    file.update_file(file_type, 'h264' if file_type == 'video' else 'jpg', 1000)
+    values = numpy.random.RandomState(seed).rand(rows, len(schema))
+    file.set_features(schema, values)
+    return file, values.astype(numpy.float32)
+
+
+def test_image_dataframe_matches_old_feature_dict():
+    file, values = make_file('cover.jpg', 'image', FARID_SCHEMA, 1, 0)
+    # the old File held { column : value } & classified pandas.DataFrame(features, index=[file_name])
+    old_features = {column: float(value) for column, value in zip(FARID_SCHEMA.columns, values[0])}
+    pandas.testing.assert_frame_equal(file.to_dataframe(), pandas.DataFrame(old_features, index=['cover.jpg']))
+
+
+def test_video_dataframe_matches_old_gop_dicts():
+    file, values = make_file('clip.h264', 'video', NPELO_SCHEMA, 5, 1)
+    # the old File held { <file>_f<n> : { column : value } } & classified DataFrame.from_dict(orient='index')
+    old_features = {'clip.h264_f{}'.format(i + 1): {column: float(value) for column, value in zip(NPELO_SCHEMA.columns, row)}
+                    for i, row in enumerate(values)}
+    pandas.testing.assert_frame_equal(file.to_dataframe(), pandas.DataFrame.from_dict(old_features, orient='index'))
+
+
+def test_stacked_dataframe_keeps_each_files_rows():
+    files = [make_file('clip{}.h264'.format(i), 'video', NPELO_SCHEMA, rows, i)[0] for i, rows in enumerate((3, 1, 4))]
+    stacked = features_dataframe(files)
+    pandas.testing.assert_frame_equal(stacked, pandas.concat([file.to_dataframe() for file in files]))
+    assert list(stacked.index[3:5]) == ['clip1.h264_f1', 'clip2.h264_f1']
+
+
+def test_csv_rows_match_old_layout():
+    file, values = make_file('clip.h264', 'video', NPELO_SCHEMA, 2, 2)
+    rows = list(file.to_rows(1))
+    assert [row['file_name'] for row in rows] == ['clip.h264_f1', 'clip.h264_f2']
+    assert list(rows[0]) == ['file_name'] + list(NPELO_SCHEMA.columns) + ['class']
+    assert float(rows[1]['NPELO_36']) == values[1][35] and rows[1]['class'] == 1
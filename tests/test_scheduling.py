@@ -0,0 +1,61 @@
+import os
+import json
+import scheduling
+from scheduling import TimingHistory, plan, schedule_jobs, job_from_record
+
+JPEG_HEADER = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+
+
+def write_image(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(JPEG_HEADER + bytes(size))
+    return str(path)
+
+
+def test_plan_keeps_input_positions(tmp_path):
+    small = write_image(tmp_path, 'small.jpg', 1000)
+    large = write_image(tmp_path, 'large.jpg', 4000000)
+    missing = str(tmp_path / 'missing.jpg')
+    schedule = plan([small, missing, large], TimingHistory(None))
+    assert schedule.file_names() == [large, small, missing]
+    assert schedule.positions() == {small: 0, missing: 1, large: 2}
+    assert [job.file_name for job in schedule.input_order()] == [small, missing, large]
+    assert [[record['position'] for record in batch] for batch in schedule.batches(2)] == [[2], [0, 1]]
+    # the planned type is reused rather than detected again
+    file = schedule.jobs[0].to_file()
+    assert (file.file_type, file.file_size) == ('image', os.path.getsize(large))
+
+
+def test_job_record_rebuilds_the_job_without_detecting(tmp_path, monkeypatch):
+    small = write_image(tmp_path, 'small.jpg', 1000)
+    large = write_image(tmp_path, 'large.jpg', 4000000)
+    history = TimingHistory(None)
+    batch = [job.to_record() for job in plan([small, large], history).jobs]
+    # as a worker would, from a batch file
+    monkeypatch.setattr(scheduling, 'get_file_type', None)
+    jobs = [job_from_record(json.loads(json.dumps(record))) for record in batch]
+    schedule = schedule_jobs(jobs, history, order='input')
+    assert schedule.file_names() == [small, large] and schedule.positions() == {small: 0, large: 1}
+    assert [job.to_record() for job in schedule.input_order()] == sorted(batch, key=lambda record: record['position'])
+    assert schedule.jobs[1].estimate == history.estimate('image', schedule.jobs[1].file_size / scheduling.MB)
+
+
+def test_history_save_merges_other_writers_runs(tmp_path):
+    path = str(tmp_path / 'timings.json')
+    first = TimingHistory(path)
+    second = TimingHistory(path)
+    first.record('image', 1.0, 2.0)
+    second.record('image', 3.0, 4.0)
+    first.save()
+    second.save()
+    with open(path) as history_file:
+        assert json.load(history_file) == {'image': {'runs': 2, 'seconds': 6.0, 'units': 4.0}}
+    assert TimingHistory(path).totals == second.totals
+
+
+def test_history_without_path_is_not_saved(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    history = TimingHistory('')
+    history.record('image', 1.0, 2.0)
+    history.save()
+    assert os.listdir(str(tmp_path)) == []
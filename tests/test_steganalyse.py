@@ -0,0 +1,71 @@
+import os
+import signal
+import pandas
+import pytest
+from conftest import load_script
+from scheduling import TimingHistory
+from work_queue import Spool, ForkedWorker
+
+steganalyse = load_script('steganalyse.py')
+
+JPEG_HEADER = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00'
+LEASE_TIMEOUT = 2
+POLL_INTERVAL = 0.1
+
+
+def write_images(tmp_path, sizes):
+    file_names = []
+    for name, size in sizes:
+        path = tmp_path / name
+        path.write_bytes(JPEG_HEADER + bytes(size))
+        file_names.append(str(path))
+    return file_names
+
+
+# FUNCTION: STAND-IN FOR THE PIPELINE THAT KILLS ITS WORKER PART WAY THROUGH ONE FILE, THE FIRST TIME IT SEES IT
+def stub_pipeline(crash_file, marker):
+    def run_pipeline(jobs, classifiers, limits=None, sample_config=None, policies=None):
+        file_list = []
+        for job in jobs:
+            if job.file_name == crash_file and not os.path.exists(marker):
+                open(marker, 'w').close()
+                os.kill(os.getpid(), signal.SIGKILL)
+            file = job.to_file()
+            file.classification = {'svm': 'clean', 'lr': os.path.basename(job.file_name)}
+            file_list.append(file)
+        return file_list, {}
+    return run_pipeline
+
+
+def never_finished(*args):
+    pytest.fail('spool never finished')
+
+
+def test_workers_survive_a_killed_worker(tmp_path, monkeypatch, capsys):
+    file_names = write_images(tmp_path, [('a.jpg', 1000), ('b.jpg', 3000000), ('c.jpg', 2000), ('d.jpg', 2000000),
+                                         ('e.jpg', 1000), ('f.jpg', 500000)])
+    monkeypatch.setattr(steganalyse, 'run_pipeline', stub_pipeline(file_names[2], str(tmp_path / 'crashed')))
+    spool_dir = str(tmp_path / 'spool')
+    output_file = str(tmp_path / 'classifications.csv')
+
+    def start_worker():
+        # forked, so each worker gets the stub pipeline
+        return ForkedWorker(steganalyse.run_worker, Spool(spool_dir, LEASE_TIMEOUT), {}, None, None, POLL_INTERVAL)
+
+    # fail rather than hang if a batch is never finished
+    previous = signal.signal(signal.SIGALRM, never_finished)
+    signal.alarm(60)
+    try:
+        steganalyse.run_coordinator(Spool(spool_dir, LEASE_TIMEOUT), output_file, file_names, 2, 3, start_worker,
+                                    POLL_INTERVAL, TimingHistory(None))
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+    output = capsys.readouterr().out
+    assert 'Local worker exited with -9, restarting' in output
+    assert 'expired, re-issuing' in output
+    # every file once, in input order, whichever worker ran it
+    classifications_df = pandas.read_csv(output_file, index_col=0)
+    assert list(classifications_df['File name']) == file_names
+    assert list(classifications_df['LR Classification']) == [os.path.basename(name) for name in file_names]
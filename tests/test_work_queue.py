@@ -0,0 +1,104 @@
+import gc
+import sys
+import os
+import time
+import pandas
+from work_queue import Spool, ForkedWorker, LEASE_SUFFIX
+
+
+def make_spool(tmp_path, batches, lease_timeout=60):
+    # file names without a position are numbered in the order given
+    position = iter(range(sum(len(batch) for batch in batches)))
+    batches = [[{'position': entry[0], 'file_name': entry[1]} if isinstance(entry, tuple) else
+                {'position': next(position), 'file_name': entry} for entry in batch] for batch in batches]
+    spool = Spool(str(tmp_path / 'spool'), lease_timeout)
+    spool.create(batches)
+    return spool
+
+
+def expire(lease_file, spool):
+    old = time.time() - spool.lease_timeout - 1
+    os.utime(lease_file, (old, old))
+
+
+def lease_files(spool):
+    return sorted(name for name in os.listdir(spool.leased_dir) if name.endswith(LEASE_SUFFIX))
+
+
+def test_lease_complete_and_merge(tmp_path):
+    spool = make_spool(tmp_path, [['a.jpg', 'b.jpg'], ['c.jpg']])
+    for worker in ('host-1', 'host-2'):
+        lease = spool.lease(worker)
+        spool.complete(lease, pandas.DataFrame({'File name': lease.file_names}), worker)
+    assert spool.lease('host-3') is None and spool.is_finished()
+    assert os.listdir(spool.leased_dir) == []
+    assert list(spool.merge(str(tmp_path / 'out.csv'))['File name']) == ['a.jpg', 'b.jpg', 'c.jpg']
+
+
+def test_merge_restores_input_order(tmp_path):
+    # sharded longest first, so the batches & the files within them are out of input order
+    spool = make_spool(tmp_path, [[(3, 'd.mp4')], [(2, 'c.mp4'), (0, 'a.jpg')], [(1, 'b.jpg')]])
+    leases = [spool.lease('host-{}'.format(number)) for number in range(3)]
+    assert leases[1].file_names == ['c.mp4', 'a.jpg'] and leases[1].positions == [2, 0]
+    # batches finish in any order
+    for number in (2, 1, 0):
+        classifications_df = pandas.DataFrame({'File name': leases[number].file_names,
+                                               'SVM Classification': ['clean'] * len(leases[number].file_names)})
+        spool.complete(leases[number], classifications_df, 'host-{}'.format(number))
+    merged = spool.merge(str(tmp_path / 'out.csv'))
+    assert list(merged['File name']) == ['a.jpg', 'b.jpg', 'c.mp4', 'd.mp4']
+    assert list(merged.columns) == ['File name', 'SVM Classification'] and list(merged.index) == [1, 2, 3, 4]
+
+
+def test_expired_lease_is_reissued(tmp_path):
+    spool = make_spool(tmp_path, [['a.jpg']])
+    lease = spool.lease('host-1')
+    lease.stop()
+    assert spool.reclaim_expired() == []
+    expire(lease.lease_file, spool)
+    assert spool.reclaim_expired() == [lease.batch]
+    assert spool.lease('host-2').file_names == ['a.jpg']
+
+
+def test_reclaim_never_removes_a_new_holders_lease(tmp_path):
+    spool = make_spool(tmp_path, [['a.jpg']])
+    first = spool.lease('host-1')
+    first.stop()
+    expire(first.lease_file, spool)
+    assert spool.reclaim_expired() == [first.batch]
+    # leased again at once - the old & new leases use different files
+    second = spool.lease('host-2')
+    assert spool.reclaim_expired() == []
+    assert lease_files(spool) == [os.path.basename(second.lease_file)]
+    second.stop()
+    # the first holder finishing late does not disturb the second's lease
+    spool.complete(first, pandas.DataFrame({'File name': first.file_names}), 'host-1')
+    assert os.path.exists(second.lease_file)
+
+
+def test_batch_without_lease_file_is_reclaimed(tmp_path):
+    spool = make_spool(tmp_path, [['a.jpg']])
+    lease = spool.lease('host-1')
+    lease.stop()
+    os.remove(lease.lease_file)
+    assert spool.reclaim_expired() == [lease.batch]
+    assert spool.lease('host-2') is not None
+
+
+def test_orphaned_lease_file_is_removed(tmp_path):
+    spool = make_spool(tmp_path, [['a.jpg']])
+    # a worker that wrote its lease file but stopped before claiming the batch
+    orphan = spool.lease_path('batch-000001.txt', 'host-1')
+    open(orphan, 'w').close()
+    assert spool.reclaim_expired() == [] and os.path.exists(orphan)
+    expire(orphan, spool)
+    spool.reclaim_expired()
+    assert not os.path.exists(orphan)
+    assert spool.lease('host-2') is not None
+
+
+def test_forked_worker_without_gc_freeze(monkeypatch):
+    # gc.freeze is new in Python 3.7
+    monkeypatch.delattr(gc, 'freeze', raising=False)
+    worker = ForkedWorker(sys.exit, 3)
+    assert worker.wait() == 3 and worker.returncode == 3
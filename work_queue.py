@@ -0,0 +1,264 @@
+import gc
+import os
+import os.path
+import json
+import time
+import socket
+import threading
+import multiprocessing
+import pandas
+
+
+# --------------------------------------------
+
+# CONSTANTS
+
+# --------------------------------------------
+
+
+SPOOL_INFO = 'spool.json'
+BATCH_PREFIX = 'batch-'
+LEASE_SUFFIX = '.lease'
+POSITION_COLUMN = 'Input Position'  # kept in batch results so merged results follow the input, then dropped
+
+
+# --------------------------------------------
+
+# CLASSES
+
+# --------------------------------------------
+
+
+class Lease:
+    """
+    A batch claimed by one worker, kept alive by touching its lease file.
+
+    Attributes:
+        batch: A string containing the batch file name (batch-000001.txt)
+        records: A list of dicts, one per file, as the batch was created with
+        file_names: A list containing the file names in the batch
+        positions: A list containing each file's position in the whole input
+        lease_file: A string containing the lease file path
+    """
+
+    def __init__(self, batch, records, lease_file, heartbeat):
+        self.batch = batch
+        self.records = records
+        self.file_names = [record['file_name'] for record in records]
+        self.positions = [record['position'] for record in records]
+        self.lease_file = lease_file
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.beat, args=(heartbeat,), daemon=True)
+        self.thread.start()
+
+    def beat(self, heartbeat):
+        while not self.stopped.wait(heartbeat):
+            try:
+                os.utime(self.lease_file)
+            except OSError:
+                return  # lease was re-issued by the coordinator
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class ForkedWorker:
+    """
+    A local worker forked from the coordinator, sharing its loaded classifiers copy-on-write.
+
+    Has the parts of subprocess.Popen the coordinator uses, so either kind of local worker can be managed alike.
+
+    Attributes:
+        process: The multiprocessing Process running the worker
+        pid: An int containing the worker's process id
+    """
+
+    def __init__(self, target, *args):
+        # keep the garbage collector from touching (so copying) every page of the parent's objects in the child
+        # (Python 3.7+ - on older versions the child just copies more pages than it needs to)
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+        self.process = multiprocessing.get_context('fork').Process(target=target, args=args)
+        self.process.start()
+        self.pid = self.process.pid
+
+    @property
+    def returncode(self):
+        return self.process.exitcode
+
+    def poll(self):
+        return self.process.exitcode
+
+    def wait(self):
+        self.process.join()
+        return self.process.exitcode
+
+
+class Spool:
+    """
+    A shared spool directory of file batches: pending/ -> leased/ -> done/.
+
+    Batches are claimed with an atomic rename, so any number of workers (on any host that can see the
+    directory) can pull from it. Each holder touches its own lease file, & leased batches whose lease files
+    stop being touched (or are missing) are moved back to pending/.
+
+    Attributes:
+        spool_dir: A string containing the spool directory path
+        lease_timeout: A float containing the seconds after which a silent lease is re-issued
+    """
+
+    def __init__(self, spool_dir, lease_timeout=600):
+        self.spool_dir = spool_dir
+        self.lease_timeout = lease_timeout
+        self.pending_dir = os.path.join(spool_dir, 'pending')
+        self.leased_dir = os.path.join(spool_dir, 'leased')
+        self.done_dir = os.path.join(spool_dir, 'done')
+
+    def is_ready(self):
+        return os.path.isfile(os.path.join(self.spool_dir, SPOOL_INFO))
+
+    def create(self, batches):
+        # batches are lists of dicts with at least a file_name & an input position, leased in the order given,
+        # so put the longest first
+        for dir_path in (self.pending_dir, self.leased_dir, self.done_dir):
+            os.makedirs(dir_path, exist_ok=True)
+        for number, batch in enumerate(batches, 1):
+            batch_path = os.path.join(self.pending_dir, '{}{:06d}.txt'.format(BATCH_PREFIX, number))
+            with open(batch_path, 'w') as batch_file:
+                batch_file.write(''.join(json.dumps(record) + '\n' for record in batch))
+        # written last, so workers never see a half-sharded spool
+        with open(os.path.join(self.spool_dir, SPOOL_INFO), 'w') as info_file:
+            json.dump({'batches': len(batches), 'files': sum(len(batch) for batch in batches)}, info_file)
+        return len(batches)
+
+    def total_batches(self):
+        with open(os.path.join(self.spool_dir, SPOOL_INFO), 'r') as info_file:
+            return json.load(info_file)['batches']
+
+    def done_path(self, batch):
+        return os.path.join(self.done_dir, batch.replace('.txt', '.csv'))
+
+    def done_batches(self):
+        return len([name for name in os.listdir(self.done_dir) if name.endswith('.csv')])
+
+    def is_finished(self):
+        return self.done_batches() >= self.total_batches()
+
+    def lease_path(self, batch, worker_id):
+        # one lease file per holder, so nobody else ever writes or removes it by accident
+        return os.path.join(self.leased_dir, '{}.{}{}'.format(batch, worker_id, LEASE_SUFFIX))
+
+    def lease(self, worker_id):
+        for batch in sorted(os.listdir(self.pending_dir)):
+            pending_path = os.path.join(self.pending_dir, batch)
+            leased_path = os.path.join(self.leased_dir, batch)
+            lease_file = self.lease_path(batch, worker_id)
+            # write the lease file first so a leased batch always has one
+            with open(lease_file, 'w') as lease:
+                lease.write(worker_id)
+            try:
+                os.rename(pending_path, leased_path)
+            except OSError:
+                # another worker got there first
+                os.remove(lease_file)
+                continue
+            if os.path.exists(self.done_path(batch)):
+                # finished by a worker whose lease had expired
+                self.release(batch, lease_file)
+                continue
+            with open(leased_path, 'r') as batch_file:
+                records = [json.loads(line) for line in batch_file if line.strip()]
+            return Lease(batch, records, lease_file, max(1.0, self.lease_timeout / 3))
+        return None
+
+    def release(self, batch, lease_file):
+        for path in (os.path.join(self.leased_dir, batch), lease_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def complete(self, lease, classifications_df, worker_id):
+        lease.stop()
+        done_path = self.done_path(lease.batch)
+        temp_path = '{}.{}.tmp'.format(done_path, worker_id)
+        positions = dict(zip(lease.file_names, lease.positions))
+        classifications_df = classifications_df.assign(**{
+            POSITION_COLUMN: [positions[file_name] for file_name in classifications_df.iloc[:, 0]]})
+        classifications_df.to_csv(temp_path, index=False)
+        # rename is atomic, so the coordinator only ever sees whole results
+        os.replace(temp_path, done_path)
+        self.release(lease.batch, lease.lease_file)
+
+    def reclaim_expired(self):
+        reclaimed = []
+        now = time.time()
+        # batches are listed before lease files, as a batch only reaches leased/ after its lease file is written
+        batches = [name for name in os.listdir(self.leased_dir) if not name.endswith(LEASE_SUFFIX)]
+        lease_files = {}
+        for name in os.listdir(self.leased_dir):
+            if name.endswith(LEASE_SUFFIX):
+                # <batch>.<worker id>.lease
+                lease_files.setdefault(name[:name.index('.txt.') + 4], []).append(os.path.join(self.leased_dir, name))
+        for batch in sorted(batches):
+            leased_path = os.path.join(self.leased_dir, batch)
+            batch_leases = lease_files.pop(batch, [])
+            if os.path.exists(self.done_path(batch)):
+                for path in [leased_path] + batch_leases:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass  # already released by its holder
+                continue
+            try:
+                if any(now - os.path.getmtime(lease_file) <= self.lease_timeout for lease_file in batch_leases):
+                    continue
+            except OSError:
+                continue  # released while being checked
+            # expired, or its lease file is missing - remove the old lease before the batch can be leased again
+            try:
+                for lease_file in batch_leases:
+                    os.remove(lease_file)
+                os.rename(leased_path, os.path.join(self.pending_dir, batch))
+                reclaimed.append(batch)
+            except OSError:
+                continue
+        # lease files left by workers that stopped between writing one & claiming the batch
+        for batch, batch_leases in lease_files.items():
+            for lease_file in batch_leases:
+                try:
+                    if now - os.path.getmtime(lease_file) > self.lease_timeout:
+                        os.remove(lease_file)
+                except OSError:
+                    pass
+        return reclaimed
+
+    def merge(self, output_file):
+        batch_csvs = sorted(name for name in os.listdir(self.done_dir) if name.endswith('.csv'))
+        if not batch_csvs:
+            return pandas.DataFrame()
+        classifications_df = pandas.concat([pandas.read_csv(os.path.join(self.done_dir, name), dtype=str)
+                                            for name in batch_csvs], ignore_index=True, sort=False)
+        # back into input order, whichever worker ran each batch & in whatever order
+        classifications_df[POSITION_COLUMN] = classifications_df[POSITION_COLUMN].astype(int)
+        classifications_df = classifications_df.sort_values(POSITION_COLUMN, kind='mergesort')
+        classifications_df = classifications_df.drop(columns=POSITION_COLUMN).reset_index(drop=True)
+        classifications_df.index += 1
+        classifications_df.to_csv(output_file)
+        return classifications_df
+
+
+# --------------------------------------------
+
+# FUNCTIONS
+
+# --------------------------------------------
+
+
+# FUNCTION: CHECK IF LOCAL WORKERS CAN BE FORKED (NOT ON WINDOWS)
+def can_fork():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+# FUNCTION: GET AN ID FOR THIS WORKER PROCESS
+def worker_id():
+    return '{}-{}'.format(socket.gethostname(), os.getpid())